@@ -0,0 +1,202 @@
+import copy
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional, Union
+
+from metrics import WS_SEND_SECONDS
+from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+# WebSocket close code for clients dropped because they could not keep up
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class ClientChannel:
+    """Outgoing side of one WebSocket client.
+
+    Status frames are latest-value-wins: a newer one replaces the one still waiting
+    to be sent. When frames are deltas the replaced one would be lost, so the pending
+    frame becomes the `fallback` instead (a full snapshot built at send time). Other
+    messages (replies, events) go through a bounded queue; a client whose queue
+    overflows, or whose send takes longer than `send_timeout`, is dropped.
+    """
+
+    def __init__(self, websocket, max_queue: int = 32, send_timeout: float = 2.0, binary: bool = False):
+        self.websocket = websocket
+        self.binary = binary  # Status frames as packed structs instead of JSON deltas
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.send_timeout = send_timeout
+        self.latest: Optional[Union[str, bytes, Callable[[], str]]] = None
+        self.wakeup = asyncio.Event()
+        self.closed = False
+        self.dropped = 0  # Status frames replaced before they were sent
+        self.task = asyncio.create_task(self._run())
+
+    def offer(self, text: Union[str, bytes], fallback: Optional[Callable[[], str]] = None):
+        """Replace the pending status frame"""
+        if self.latest is not None:
+            self.dropped += 1
+            if fallback is not None:
+                text = fallback
+        self.latest = text
+        self.wakeup.set()
+
+    def push(self, text: Union[str, bytes]) -> bool:
+        """Queue a message that must not be coalesced; False if the client is too far behind"""
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            return False
+        self.wakeup.set()
+        return True
+
+    async def _run(self):
+        try:
+            while not self.closed:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+
+                while not self.queue.empty():
+                    await self._send(self.queue.get_nowait())
+                if self.latest is not None:
+                    text, self.latest = self.latest, None
+                    await self._send(text() if callable(text) else text)
+        except Exception as e:
+            if not self.closed:
+                logger.info(f"Dropping websocket client: {e!r}")
+            self.close()
+
+    async def _send(self, data: Union[str, bytes]):
+        with WS_SEND_SECONDS.time():
+            if isinstance(data, bytes):
+                await asyncio.wait_for(self.websocket.send_bytes(data), timeout=self.send_timeout)
+            else:
+                await asyncio.wait_for(self.websocket.send_text(data), timeout=self.send_timeout)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+        except Exception:
+            pass
+
+
+class Broadcaster:
+    """Fans messages out to every WebSocket client without the caller awaiting any send"""
+
+    def __init__(self, max_queue: int = 32, send_timeout: float = 2.0):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.clients: Dict[Any, ClientChannel] = {}
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def add(self, websocket, binary: bool = False) -> ClientChannel:
+        channel = ClientChannel(websocket, self.max_queue, self.send_timeout, binary)
+        self.clients[websocket] = channel
+        return channel
+
+    def remove(self, websocket):
+        channel = self.clients.pop(websocket, None)
+        if channel:
+            channel.closed = True
+            channel.task.cancel()
+
+    def _prune(self):
+        for websocket, channel in list(self.clients.items()):
+            if channel.closed:
+                self.clients.pop(websocket, None)
+
+    def publish(self, text: Optional[str], fallback: Optional[Callable[[], str]] = None,
+                binary: Optional[bytes] = None):
+        """Latest-value-wins status frame for every client, in the encoding it asked for"""
+        self._prune()
+        for channel in self.clients.values():
+            if channel.binary:
+                if binary is not None:
+                    channel.offer(binary)
+            elif text is not None:
+                channel.offer(text, fallback)
+
+    def has_binary(self) -> bool:
+        return any(channel.binary for channel in self.clients.values())
+
+    def send(self, websocket, text: Union[str, bytes]):
+        """Queued message for one client"""
+        channel = self.clients.get(websocket)
+        if channel and not channel.push(text):
+            logger.info("Dropping websocket client: send queue full")
+            channel.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'clients': len(self.clients),
+            'dropped_frames': sum(channel.dropped for channel in self.clients.values())
+        }
+
+
+def merge_patch(old: Any, new: Any) -> Optional[Dict[str, Any]]:
+    """Merge patch turning `old` into `new`, or None if they are equal.
+
+    Nested dicts are diffed key by key and anything else (lists included) is replaced
+    whole. Unlike RFC 7386, null is a plain value: status keys are never removed.
+    """
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return None if old == new else new
+
+    patch = {}
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+        elif isinstance(value, dict) and isinstance(old[key], dict):
+            child = merge_patch(old[key], value)
+            if child:
+                patch[key] = child
+        elif old[key] != value:
+            patch[key] = value
+    return patch or None
+
+
+class DeltaStream:
+    """Sequenced status stream: full snapshots on demand, merge-patch deltas otherwise.
+
+    Frames are {"type": "snapshot" | "delta", "seq": n, "data": ...}. A client applies
+    delta n only on top of state n - 1; on a gap it sends {"type": "resync"} and waits
+    for the next snapshot.
+    """
+
+    def __init__(self):
+        self.seq = 0
+        self.state: Dict[str, Any] = {}
+        self._snapshot: Optional[str] = None
+
+    def update(self, state: Dict[str, Any]) -> Optional[str]:
+        """Delta frame for a new state, or None if nothing changed"""
+        patch = merge_patch(self.state, state)
+        if patch is None:
+            return None
+        self.seq += 1
+        self.state = copy.deepcopy(state)
+        self._snapshot = None
+        return dumps({'type': 'delta', 'seq': self.seq, 'data': patch})
+
+    def snapshot(self) -> str:
+        """Full state frame at the current sequence number (cached until the next change)"""
+        if self._snapshot is None:
+            self._snapshot = dumps({'type': 'snapshot', 'seq': self.seq, 'data': self.state})
+        return self._snapshot
+
+    def reset(self):
+        self.seq = 0
+        self.state = {}
+        self._snapshot = None
@@ -0,0 +1,107 @@
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, 1 ms to 5 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_value(value: float) -> str:
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, optionally split by one label.
+
+    Observing is a bisect and three increments under a lock; cumulative bucket
+    counts are only computed when the metrics are rendered.
+    """
+
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None,
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Optional[str], List] = {}  # label value -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, label_value: Optional[str] = None):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    @contextmanager
+    def time(self, label_value: Optional[str] = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, label_value)
+
+    def timed(self, label_value: Optional[str] = None):
+        """Decorator observing every call of a function"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, label_value)
+            return wrapper
+        return decorator
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self.series.items()]
+
+        for label_value, counts, total, count in sorted(series, key=lambda item: str(item[0])):
+            labels = f'{self.label}="{label_value}",' if self.label and label_value is not None else ''
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels}le="{_format_value(bound)}"}} {cumulative}')
+            suffix = '{' + labels.rstrip(',') + '}' if labels else ''
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+def render_samples(name: str, kind: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Text exposition lines for a counter or gauge computed at scrape time"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+
+CAPTURE_SECONDS = Histogram('tibia_capture_seconds', 'Screen capture time')
+OCR_SECONDS = Histogram('tibia_ocr_seconds', 'Tesseract OCR time', label='region')
+DETECTOR_SECONDS = Histogram('tibia_detector_seconds', 'Detector run time', label='detector')
+ACTION_LATENCY_SECONDS = Histogram('tibia_action_latency_seconds', 'Time from frame capture to the input it triggered',
+                                   label='action')
+LOOP_TICK_SECONDS = Histogram('tibia_loop_tick_seconds', 'Bot loop iteration time, excluding the sleep between ticks')
+WS_SEND_SECONDS = Histogram('tibia_websocket_send_seconds', 'Time to send one websocket frame')
+
+HISTOGRAMS = [CAPTURE_SECONDS, OCR_SECONDS, DETECTOR_SECONDS, ACTION_LATENCY_SECONDS, LOOP_TICK_SECONDS, WS_SEND_SECONDS]
+
+
+def render_histograms() -> List[str]:
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return lines
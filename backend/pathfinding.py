@@ -0,0 +1,311 @@
+import os
+import json
+import heapq
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+logger = logging.getLogger(__name__)
+
+Position = Tuple[int, int, int]  # world x, y, floor
+
+# Minimap colors (BGR) that cannot be walked on when no walkable_<z>.npy is provided
+BLOCKING_COLORS = [
+    (0, 0, 0),        # unexplored
+    (0, 51, 255),     # walls
+    (153, 102, 51),   # water
+    (102, 102, 102),  # mountain / rock
+    (0, 102, 0),      # trees
+]
+
+NEIGHBOURS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, -1), (-1, 1), (1, 1)]
+
+
+class WalkabilityGrid:
+    """Per-floor walkability stored as packed bits (1 = walkable), in world coordinates"""
+
+    def __init__(self, origin: Tuple[int, int], floors: Dict[int, np.ndarray]):
+        self.origin_x, self.origin_y = origin
+        self.floors: Dict[int, np.ndarray] = {}
+        self.widths: Dict[int, int] = {}
+        for z, walkable in floors.items():
+            self.set_floor(z, walkable)
+
+    def set_floor(self, z: int, walkable: np.ndarray):
+        self.floors[z] = np.packbits(np.asarray(walkable, dtype=bool), axis=1)
+        self.widths[z] = walkable.shape[1]
+
+    @classmethod
+    def load(cls, atlas_dir: str) -> 'WalkabilityGrid':
+        """Build from a map atlas directory (walkable_<z>.npy, or derived from floor_<z>.npy colors)"""
+        root = Path(atlas_dir)
+        with open(root / 'atlas.json', 'r', encoding='utf-8') as f:
+            info = json.load(f)
+
+        floors = {}
+        for z in info['floors']:
+            walkable_path = root / f'walkable_{z}.npy'
+            if walkable_path.exists():
+                floors[int(z)] = np.load(walkable_path)
+            else:
+                atlas = np.load(root / f'floor_{z}.npy', mmap_mode='r')
+                blocked = np.zeros(atlas.shape[:2], dtype=bool)
+                for color in BLOCKING_COLORS:
+                    blocked |= (atlas == np.array(color, dtype=atlas.dtype)).all(axis=-1)
+                floors[int(z)] = ~blocked
+        return cls(tuple(info['origin']), floors)
+
+    def window(self, z: int, left: int, top: int, right: int, bottom: int) -> Optional[np.ndarray]:
+        """Unpacked bool array for the world rectangle [left, right) x [top, bottom), clipped to the map"""
+        packed = self.floors.get(z)
+        if packed is None:
+            return None
+        x0 = max(0, left - self.origin_x)
+        y0 = max(0, top - self.origin_y)
+        x1 = min(self.widths[z], right - self.origin_x)
+        y1 = min(packed.shape[0], bottom - self.origin_y)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        rows = np.unpackbits(packed[y0:y1, x0 // 8:(x1 + 7) // 8], axis=1)
+        offset = x0 - (x0 // 8) * 8
+        return rows[:, offset:offset + (x1 - x0)].astype(bool)
+
+    def is_walkable(self, x: int, y: int, z: int) -> bool:
+        packed = self.floors.get(z)
+        col, row = x - self.origin_x, y - self.origin_y
+        if packed is None or row < 0 or col < 0 or row >= packed.shape[0] or col >= self.widths[z]:
+            return False
+        return bool((packed[row, col >> 3] >> (7 - (col & 7))) & 1)
+
+
+class Pathfinder:
+    """A* over a WalkabilityGrid with an LRU cache of computed paths"""
+
+    def __init__(self, grid: WalkabilityGrid, cache_size: int = 256, margin: int = 32,
+                 max_nodes: int = 200000, diagonal_cost: float = 1.41):
+        self.grid = grid
+        self.cache_size = cache_size
+        self.margin = margin            # Tiles first searched beyond the start/goal bounding box
+        self.max_nodes = max_nodes
+        self.diagonal_cost = diagonal_cost
+        self.cache: 'OrderedDict[Tuple[Position, Position], Optional[List[Position]]]' = OrderedDict()
+
+    def clear_cache(self):
+        self.cache.clear()
+
+    def find_path(self, start: Position, goal: Position) -> Optional[List[Position]]:
+        """Tiles from start (excluded) to goal (included), or None if unreachable"""
+        key = (tuple(start), tuple(goal))
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        # Search a box around start/goal first, widening it when walls force a detour
+        path = None
+        for margin in (self.margin, self.margin * 8, None):
+            path = self._astar(start, goal, margin)
+            if path is not None:
+                break
+
+        self.cache[key] = path
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return path
+
+    def _astar(self, start: Position, goal: Position, margin: Optional[int]) -> Optional[List[Position]]:
+        sx, sy, sz = start
+        gx, gy, gz = goal
+        if sz != gz:
+            return None  # Floor changes go through explicit waypoints (stairs, ropes)
+        if (sx, sy) == (gx, gy):
+            return []
+
+        if margin is None:
+            margin = 1 << 16  # Whole floor
+        left = min(sx, gx) - margin
+        top = min(sy, gy) - margin
+        area = self.grid.window(sz, left, top, max(sx, gx) + margin + 1, max(sy, gy) + margin + 1)
+        if area is None:
+            return None
+        left = max(left, self.grid.origin_x)
+        top = max(top, self.grid.origin_y)
+        height, width = area.shape
+        walkable = area.tolist()
+
+        start_cell = (sx - left, sy - top)
+        goal_cell = (gx - left, gy - top)
+        if not (0 <= goal_cell[0] < width and 0 <= goal_cell[1] < height) or not walkable[goal_cell[1]][goal_cell[0]]:
+            return None
+
+        diagonal = self.diagonal_cost
+
+        def heuristic(x: int, y: int) -> float:
+            dx, dy = abs(x - goal_cell[0]), abs(y - goal_cell[1])
+            return max(dx, dy) + (diagonal - 1) * min(dx, dy)
+
+        open_heap = [(heuristic(*start_cell), 0.0, start_cell)]
+        came_from = {start_cell: None}
+        cost = {start_cell: 0.0}
+        expanded = 0
+
+        while open_heap:
+            _, g, current = heapq.heappop(open_heap)
+            if current == goal_cell:
+                break
+            if g > cost[current]:
+                continue
+            expanded += 1
+            if expanded > self.max_nodes:
+                return None
+
+            cx, cy = current
+            for dx, dy in NEIGHBOURS:
+                nx, ny = cx + dx, cy + dy
+                if not (0 <= nx < width and 0 <= ny < height) or not walkable[ny][nx]:
+                    continue
+                # No corner cutting through walls
+                if dx and dy and not (walkable[cy][nx] and walkable[ny][cx]):
+                    continue
+                ng = g + (diagonal if dx and dy else 1.0)
+                if ng < cost.get((nx, ny), float('inf')):
+                    cost[(nx, ny)] = ng
+                    came_from[(nx, ny)] = current
+                    heapq.heappush(open_heap, (ng + heuristic(nx, ny), ng, (nx, ny)))
+        else:
+            return None
+
+        path = []
+        node = goal_cell
+        while node != start_cell:
+            path.append((node[0] + left, node[1] + top, sz))
+            node = came_from[node]
+        path.reverse()
+        return path
+
+    @staticmethod
+    def next_step(path: List[Position], position: Position, view_x: int = 7, view_y: int = 5) -> Optional[Position]:
+        """Furthest tile of the path that is still visible on screen from the current position.
+
+        Long routes are walked by repeatedly clicking this tile; the remaining path is
+        resumed from the tile nearest to where the character actually is.
+        """
+        if not path:
+            return None
+        px, py, pz = position
+
+        # Resume from the path tile closest to the current position
+        nearest = min(range(len(path)), key=lambda i: max(abs(path[i][0] - px), abs(path[i][1] - py)))
+        target = None
+        for tile in path[nearest:]:
+            if tile[2] != pz or abs(tile[0] - px) > view_x or abs(tile[1] - py) > view_y:
+                break
+            target = tile
+        return target or path[min(nearest, len(path) - 1)]
+
+
+class WaypointIndex:
+    """KD-trees over a route's waypoints (one per floor), used to rejoin the route from wherever the character is"""
+
+    def __init__(self, waypoints: List[Dict], default_floor: int = 7):
+        self.positions = [(wp['x'], wp['y'], wp.get('z', default_floor)) for wp in waypoints]
+        # Floor -> (tree over that floor's waypoints, their indices in the route)
+        self.trees: Dict[int, Tuple[cKDTree, np.ndarray]] = {}
+        for z in {p[2] for p in self.positions}:
+            indices = np.array([i for i, p in enumerate(self.positions) if p[2] == z])
+            points = np.array([self.positions[i][:2] for i in indices], dtype=np.float64)
+            self.trees[z] = (cKDTree(points), indices)
+
+    @staticmethod
+    def key(waypoints: List[Dict], default_floor: int = 7) -> Tuple:
+        return tuple((wp['x'], wp['y'], wp.get('z', default_floor)) for wp in waypoints)
+
+    @staticmethod
+    def successor(index: int, count: int, mode: str, direction: int) -> Optional[int]:
+        """Next waypoint index when travelling from `index`"""
+        if mode == 'loop':
+            return (index + 1) % count
+        if mode == 'back_and_forth':
+            nxt = index + direction
+            if not 0 <= nxt < count:
+                nxt = index - direction
+            return nxt if 0 <= nxt < count else None
+        return index + 1 if index + 1 < count else None
+
+    @staticmethod
+    def ahead(index: int, current: int, mode: str, direction: int) -> bool:
+        """Whether waypoint `index` is still to come when heading for `current` in `direction`"""
+        if mode == 'loop':
+            return True
+        if mode == 'back_and_forth':
+            return (index - current) * direction >= 0
+        return index >= current
+
+    @staticmethod
+    def heading(index: int, count: int, mode: str, direction: int) -> int:
+        """Direction to leave `index` in; back-and-forth routes turn around at their ends"""
+        if mode != 'back_and_forth':
+            return direction
+        if index >= count - 1:
+            return -1
+        if index <= 0:
+            return 1
+        return direction
+
+    def resume(self, position: Position, mode: str, current: int = 0, direction: int = 1,
+               pathfinder: Optional['Pathfinder'] = None,
+               candidates: int = 8) -> Optional[Tuple[int, int]]:
+        """(index, direction) of the nearest reachable waypoint still ahead on the route
+
+        Waypoints already passed in the current direction are skipped; a back-and-forth
+        route turns around only if nothing ahead is reachable. The waypoint is skipped
+        too if we are already between it and the next one.
+        """
+        floor = self.trees.get(position[2])
+        if floor is None:
+            return None
+
+        tree, route_indices = floor
+        count = len(self.positions)
+        _, order = tree.query([position[0], position[1]], k=len(route_indices))
+        order = [int(i) for i in route_indices[np.atleast_1d(order)]]
+
+        ahead = [i for i in order if self.ahead(i, current, mode, direction)]
+        passes = [(ahead, direction)]
+        if mode == 'back_and_forth':
+            passes.append(([i for i in order if i not in ahead], -direction))
+
+        nearest = None
+        for pool, heading in passes:
+            for i in pool[:candidates]:
+                if pathfinder is None or pathfinder.find_path(position, self.positions[i]) is not None:
+                    nearest, direction = i, heading
+                    break
+            if nearest is not None:
+                break
+        if nearest is None:
+            return None
+        direction = self.heading(nearest, count, mode, direction)
+
+        # Already between the nearest waypoint and the next one: head for the next one
+        nxt = self.successor(nearest, count, mode, direction)
+        if nxt is not None and nxt != nearest:
+            here = np.array(position[:2], dtype=np.float64)
+            a = np.array(self.positions[nearest][:2], dtype=np.float64)
+            b = np.array(self.positions[nxt][:2], dtype=np.float64)
+            if self.positions[nxt][2] == position[2] and np.linalg.norm(b - here) < np.linalg.norm(b - a):
+                return nxt, self.heading(nxt, count, mode, direction)
+        return nearest, direction
+
+def load_pathfinder(atlas_dir: str) -> Optional[Pathfinder]:
+    """Pathfinder for a map atlas directory, or None if there is no atlas"""
+    if not os.path.exists(os.path.join(atlas_dir, 'atlas.json')):
+        return None
+    try:
+        return Pathfinder(WalkabilityGrid.load(atlas_dir))
+    except Exception as e:
+        logger.error(f"Error loading walkability grid: {e}")
+        return None
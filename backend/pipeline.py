@@ -0,0 +1,145 @@
+import time
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    """One step of the detection pipeline.
+
+    `func` is called with the declared inputs as keyword arguments and returns a
+    dict with the declared outputs (or a bare value when there is one output).
+    `enabled` lets a stage be skipped for this run (its outputs are then None);
+    `key` fingerprints the inputs, and when the fingerprint matches the previous
+    run the previous outputs are reused without calling `func`.
+    """
+    name: str
+    func: Callable[..., Any]
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    enabled: Optional[Callable[[], bool]] = None
+    key: Optional[Callable[..., Hashable]] = None
+
+
+class Pipeline:
+    """Runs a DAG of stages, executing every stage whose inputs are ready in parallel"""
+
+    def __init__(self, stages: List[Stage], max_workers: int = 4):
+        self.stages = {stage.name: stage for stage in stages}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pipeline')
+        self.timings: Dict[str, float] = {}   # Last run time per stage, in ms
+        self._timings_lock = threading.Lock()  # Workers write timings while status readers copy them
+        self.reused: Dict[str, bool] = {}     # Whether the stage's outputs were reused last run
+        self._last_keys: Dict[str, Hashable] = {}
+        self._last_outputs: Dict[str, Dict[str, Any]] = {}
+        self.closed = False
+        self._validate()
+
+    def _validate(self):
+        """Every input must be produced by exactly one stage (or supplied to run()), with no cycles"""
+        producers: Dict[str, str] = {}
+        for stage in self.stages.values():
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"'{output}' is produced by both {producers[output]} and {stage.name}")
+                producers[output] = stage.name
+        self.producers = producers
+
+        visiting, done = set(), set()
+
+        def visit(name: str):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline cycle through stage {name}")
+            visiting.add(name)
+            for item in self.stages[name].inputs:
+                if item in producers:
+                    visit(producers[item])
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def _record(self, name: str, ms: float):
+        with self._timings_lock:
+            self.timings[name] = ms
+
+    def last_timings(self) -> Dict[str, float]:
+        """Copy of the last run time per stage, safe to take while the pipeline runs"""
+        with self._timings_lock:
+            return dict(self.timings)
+
+    def _run_stage(self, stage: Stage, values: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        kwargs = {item: values.get(item) for item in stage.inputs}
+
+        if stage.key is not None:
+            key = stage.key(**kwargs)
+            if key is not None and key == self._last_keys.get(stage.name) and stage.name in self._last_outputs:
+                self.reused[stage.name] = True
+                self._record(stage.name, (time.perf_counter() - start) * 1000)
+                return self._last_outputs[stage.name]
+        else:
+            key = None
+
+        result = stage.func(**kwargs)
+        if len(stage.outputs) == 1 and not (isinstance(result, dict) and stage.outputs[0] in result):
+            result = {stage.outputs[0]: result}
+        outputs = {item: (result or {}).get(item) for item in stage.outputs}
+
+        if stage.key is not None:
+            self._last_keys[stage.name] = key
+            self._last_outputs[stage.name] = outputs
+        self.reused[stage.name] = False
+        self._record(stage.name, (time.perf_counter() - start) * 1000)
+        return outputs
+
+    def run(self, initial: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Execute all stages once and return every produced value"""
+        values: Dict[str, Any] = dict(initial or {})
+        pending = dict(self.stages)
+        running = {}
+
+        while pending or running:
+            # Submit every stage whose inputs are all available
+            for name, stage in list(pending.items()):
+                if any(item in self.producers and item not in values for item in stage.inputs):
+                    continue
+                del pending[name]
+                if stage.enabled is not None and not stage.enabled():
+                    values.update({item: None for item in stage.outputs})
+                    self._record(name, 0.0)
+                    continue
+                try:
+                    running[self.executor.submit(self._run_stage, stage, values)] = stage
+                except RuntimeError:
+                    # Shut down mid-run: stages already running finish on their own
+                    return values
+
+            if not running:
+                if pending:
+                    # Only reachable when an input is neither produced nor supplied
+                    raise ValueError(f"Stages with unsatisfied inputs: {sorted(pending)}")
+                break
+
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    values.update(future.result())
+                except Exception as e:
+                    logger.error(f"Error in pipeline stage {stage.name}: {e}")
+                    values.update({item: None for item in stage.outputs})
+
+        return values
+
+    def shutdown(self):
+        self.closed = True
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger(__name__)
+
+# Side (in map tiles / minimap pixels) of the blocks hashed into the inverted index
+BLOCK_SIZE = 8
+
+# Query blocks with more atlas hits than this are ignored when voting
+MAX_BLOCK_HITS = 32
+
+# Vote keys pack atlas offsets into 21-bit fields (offsets may be slightly negative)
+_KEY_BIAS = 1 << 20
+_KEY_MASK = (1 << 21) - 1
+
+# Fixed odd multipliers of the block hash (must not change once an index is saved)
+_HASH_WEIGHTS = np.random.default_rng(0x7161).integers(
+    1, np.iinfo(np.int64).max, size=BLOCK_SIZE * BLOCK_SIZE * 3, dtype=np.int64
+).astype(np.uint64) | np.uint64(1)
+
+
+def block_hashes(image: np.ndarray, block: int = BLOCK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """Hash every aligned block x block tile of a BGR image.
+
+    Returns (hashes, informative) arrays of shape (rows, cols); uniform blocks
+    (water, rock, unexplored) match everywhere and are flagged as not informative.
+    """
+    rows, cols = image.shape[0] // block, image.shape[1] // block
+    blocks = image[:rows * block, :cols * block].reshape(rows, block, cols, block, 3)
+    blocks = blocks.transpose(0, 2, 1, 3, 4).reshape(rows, cols, block * block * 3)
+    hashes = (blocks.astype(np.uint64) * _HASH_WEIGHTS).sum(axis=-1, dtype=np.uint64)
+    informative = (blocks != np.tile(blocks[:, :, :3], (1, 1, block * block))).any(axis=-1)
+    return hashes, informative
+
+
+class MinimapLocator:
+    """Finds the player's world position by matching the minimap against a map atlas.
+
+    The atlas directory holds `atlas.json` ({"origin": [x, y], "floors": [7, ...]})
+    and one `floor_<z>.npy` BGR image per floor, one pixel per tile. A sorted hash
+    table of every informative aligned block (the inverted index) is built once and
+    cached in `index_<block>.npz`; a query hashes the minimap's blocks at each of the
+    block x block phase offsets and lets matching atlas blocks vote for a position.
+    When a previous position is known, a small window around it is tried first.
+    """
+
+    def __init__(self, atlas_dir: str, search_radius: int = 8, min_match: float = 0.9):
+        self.atlas_dir = Path(atlas_dir)
+        self.search_radius = search_radius
+        self.min_match = min_match
+
+        with open(self.atlas_dir / 'atlas.json', 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        self.origin_x, self.origin_y = info['origin']
+        self.floors: Dict[int, np.ndarray] = {
+            int(z): np.load(self.atlas_dir / f'floor_{z}.npy', mmap_mode='r') for z in info['floors']
+        }
+
+        self.last_position: Optional[Tuple[int, int, int]] = None
+        self.load_index()
+
+    def load_index(self):
+        """Load the cached inverted index, building it if missing or stale"""
+        index_path = self.atlas_dir / f'index_{BLOCK_SIZE}.npz'
+        atlas_mtime = max(os.path.getmtime(self.atlas_dir / f'floor_{z}.npy') for z in self.floors)
+
+        if index_path.exists() and os.path.getmtime(index_path) >= atlas_mtime:
+            index = np.load(index_path)
+            self.hashes, self.positions = index['hashes'], index['positions']
+            return
+
+        start = time.perf_counter()
+        hashes, positions = [], []
+        for z, atlas in self.floors.items():
+            floor_hashes, informative = block_hashes(np.asarray(atlas))
+            rows, cols = np.nonzero(informative)
+            hashes.append(floor_hashes[rows, cols])
+            positions.append(np.stack([np.full_like(rows, z), cols * BLOCK_SIZE, rows * BLOCK_SIZE], axis=1))
+
+        hashes = np.concatenate(hashes) if hashes else np.zeros(0, np.uint64)
+        positions = np.concatenate(positions).astype(np.int32) if positions else np.zeros((0, 3), np.int32)
+        order = np.argsort(hashes, kind='stable')
+        self.hashes, self.positions = hashes[order], positions[order]
+        np.savez(index_path, hashes=self.hashes, positions=self.positions)
+        logger.info(f"Built minimap index ({len(self.hashes)} blocks) in {time.perf_counter() - start:.1f}s")
+
+    def _match_ratio(self, minimap: np.ndarray, z: int, left: int, top: int) -> float:
+        """Fraction of minimap pixels equal to the atlas at an atlas-pixel offset"""
+        atlas = self.floors.get(z)
+        h, w = minimap.shape[:2]
+        if atlas is None or left < 0 or top < 0 or top + h > atlas.shape[0] or left + w > atlas.shape[1]:
+            return 0.0
+        return float((atlas[top:top + h, left:left + w] == minimap).all(axis=-1).mean())
+
+    def _local_search(self, minimap: np.ndarray) -> Optional[Tuple[int, int, int]]:
+        """Look for the minimap within search_radius tiles of the last known position"""
+        x, y, z = self.last_position
+        atlas = self.floors.get(z)
+        if atlas is None:
+            return None
+
+        h, w = minimap.shape[:2]
+        r = self.search_radius
+        left = x - self.origin_x - w // 2 - r
+        top = y - self.origin_y - h // 2 - r
+        if left < 0 or top < 0 or top + h + 2 * r > atlas.shape[0] or left + w + 2 * r > atlas.shape[1]:
+            return None
+
+        # Compare a small patch off the minimap center (the player marker sits on the center)
+        py, px = h // 4, w // 4
+        patch = minimap[py:py + 2 * BLOCK_SIZE, px:px + 2 * BLOCK_SIZE]
+        window = np.asarray(atlas[top + py:top + py + patch.shape[0] + 2 * r,
+                                  left + px:left + px + patch.shape[1] + 2 * r])
+        views = sliding_window_view(window, patch.shape)[:, :, 0]
+        mismatches = (views != patch).any(axis=-1).sum(axis=(-1, -2))
+        dy, dx = np.unravel_index(np.argmin(mismatches), mismatches.shape)
+
+        if self._match_ratio(minimap, z, left + dx, top + dy) < self.min_match:
+            return None
+        return (self.origin_x + left + int(dx) + w // 2, self.origin_y + top + int(dy) + h // 2, z)
+
+    def _global_search(self, minimap: np.ndarray) -> Optional[Tuple[int, int, int]]:
+        """Vote for the minimap's atlas offset with every block it shares with the atlas"""
+        if len(self.hashes) == 0:
+            return None
+
+        h, w = minimap.shape[:2]
+        votes = []
+        for oy in range(BLOCK_SIZE):
+            for ox in range(BLOCK_SIZE):
+                hashes, informative = block_hashes(minimap[oy:, ox:])
+                rows, cols = np.nonzero(informative)
+                if len(rows) == 0:
+                    continue
+                query = hashes[rows, cols]
+                lo = np.searchsorted(self.hashes, query, side='left')
+                hi = np.searchsorted(self.hashes, query, side='right')
+                # Blocks seen all over the atlas carry no information (stop words)
+                counts = np.where(hi - lo <= MAX_BLOCK_HITS, hi - lo, 0)
+                if not counts.any():
+                    continue
+
+                # Expand every query block into its atlas hits and vote for the implied top-left
+                owner = np.repeat(np.arange(len(query)), counts)
+                hits = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + lo[owner]
+                offsets = np.stack([np.zeros_like(rows), ox + cols * BLOCK_SIZE, oy + rows * BLOCK_SIZE], axis=1)
+                votes.append(self.positions[hits] - offsets[owner].astype(np.int32))
+
+        if not votes:
+            return None
+
+        # Pack (z, left, top) into one int64 key so counting votes is a flat sort
+        votes = np.concatenate(votes).astype(np.int64)
+        keys = (votes[:, 0] << 42) | ((votes[:, 1] + _KEY_BIAS) << 21) | (votes[:, 2] + _KEY_BIAS)
+        candidates, counts = np.unique(keys, return_counts=True)
+        for k in np.argsort(counts)[::-1][:3]:
+            key = int(candidates[k])
+            z, left, top = key >> 42, ((key >> 21) & _KEY_MASK) - _KEY_BIAS, (key & _KEY_MASK) - _KEY_BIAS
+            if self._match_ratio(minimap, z, left, top) >= self.min_match:
+                return (self.origin_x + left + w // 2, self.origin_y + top + h // 2, z)
+        return None
+
+    def locate(self, minimap: np.ndarray) -> Optional[Tuple[int, int, int]]:
+        """World (x, y, z) of the tile at the minimap center, or None if not found"""
+        if minimap is None or minimap.size == 0:
+            return None
+
+        minimap = np.ascontiguousarray(minimap[:, :, :3])
+        position = self._local_search(minimap) if self.last_position else None
+        if position is None:
+            position = self._global_search(minimap)
+
+        if position is not None:
+            self.last_position = position
+        return position
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: python position_locator.py <atlas_dir>")
+        sys.exit(1)
+
+    logging.basicConfig(level=logging.INFO)
+    locator = MinimapLocator(sys.argv[1])
+    logger.info(f"Minimap index ready: {len(locator.hashes)} blocks over {len(locator.floors)} floors")
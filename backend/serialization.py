@@ -0,0 +1,174 @@
+import sys
+import json
+import time
+import struct
+import logging
+import dataclasses
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Dict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    logger.info("orjson not available, using stdlib json for websocket frames")
+
+
+def default(obj: Any) -> Any:
+    """Encode the types found in bot state that plain JSON does not know"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if ORJSON_AVAILABLE:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> str:
+        """JSON text for a websocket frame (datetimes as ISO 8601, dataclasses as objects)"""
+        return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS).decode('utf-8')
+else:
+    _encoder = json.JSONEncoder(default=default, separators=(',', ':'), ensure_ascii=False)
+
+    def dumps(obj: Any) -> str:
+        """JSON text for a websocket frame (datetimes as ISO 8601, dataclasses as objects)"""
+        return _encoder.encode(obj)
+
+
+# Compact binary status frame: fixed little-endian layout, described to clients by STATUS_SCHEMA
+STATUS_VERSION = 1
+STATUS_FIELDS = [
+    ('seq', 'I'),
+    ('time_running', 'I'),
+    ('exp_gained', 'I'),
+    ('heals_used', 'I'),
+    ('food_used', 'I'),
+    ('attacks_made', 'I'),
+    ('creatures_killed', 'I'),
+    ('items_looted', 'I'),
+    ('items_discarded', 'I'),
+    ('hp_percent', 'f'),
+    ('mp_percent', 'f'),
+    ('loop_rate_hz', 'f'),
+    ('flags', 'B'),
+]
+STATUS_FLAGS = ['is_running', 'is_paused', 'is_alive', 'has_target']
+STATUS_STRUCT = struct.Struct('<' + ''.join(code for _, code in STATUS_FIELDS))
+STATUS_SCHEMA = {
+    'type': 'schema',
+    'version': STATUS_VERSION,
+    'format': STATUS_STRUCT.format,
+    'size': STATUS_STRUCT.size,
+    'fields': [name for name, _ in STATUS_FIELDS],
+    'flags': STATUS_FLAGS
+}
+
+
+def pack_status(seq: int, status: Dict[str, Any]) -> bytes:
+    """Binary frame for a get_status() dict"""
+    stats = status.get('stats') or {}
+    game_state = status.get('game_state') or {}
+    flags = (
+        bool(status.get('is_running'))
+        | bool(status.get('is_paused')) << 1
+        | bool(game_state.get('is_alive', True)) << 2
+        | bool(game_state.get('target_creature')) << 3
+    )
+    return STATUS_STRUCT.pack(
+        seq & 0xFFFFFFFF,
+        *(int(stats.get(name, 0)) & 0xFFFFFFFF for name, _ in STATUS_FIELDS[1:9]),
+        float(game_state.get('hp_percent', 0.0)),
+        float(game_state.get('mp_percent', 0.0)),
+        float(status.get('loop_rate_hz', 0.0)),
+        flags
+    )
+
+
+def unpack_status(data: bytes) -> Dict[str, Any]:
+    """Inverse of pack_status, flags expanded to booleans"""
+    values = dict(zip((name for name, _ in STATUS_FIELDS), STATUS_STRUCT.unpack(data)))
+    flags = values.pop('flags')
+    values.update({name: bool(flags >> bit & 1) for bit, name in enumerate(STATUS_FLAGS)})
+    return values
+
+
+def _benchmark(iterations: int = 20000):
+    """Compare dumps() with stdlib json, and JSON with binary status frames"""
+    from tibia_bot import GameState
+    from broadcaster import DeltaStream
+
+    frame = {
+        'type': 'stats_update',
+        'data': {
+            'session_id': 'c0ffee00-0000-4000-8000-000000000000',
+            'exp_gained': 123456, 'time_running': 3600, 'heals_used': 420, 'food_used': 12,
+            'attacks_made': 1800, 'creatures_killed': 310, 'items_looted': 950, 'items_discarded': 40,
+            'created_at': datetime.utcnow(),
+            'is_running': True, 'is_paused': False,
+            'game_state': GameState(hp_percent=87.5, mp_percent=64.0, target_creature='dragon')
+        }
+    }
+
+    results = {}
+    stdlib = json.JSONEncoder(default=default)
+    for name, encode in (('json', stdlib.encode), ('dumps', dumps)):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            encode(frame)
+        results[name] = (time.perf_counter() - start) / iterations * 1e6
+
+    backend = 'orjson' if ORJSON_AVAILABLE else 'json'
+    print(f"stdlib json: {results['json']:.1f} us/frame")
+    print(f"dumps ({backend}): {results['dumps']:.1f} us/frame ({results['json'] / results['dumps']:.1f}x)")
+    print(f"frame size: {len(dumps(frame))} bytes")
+
+    # Status stream: JSON snapshot / typical JSON delta / binary frame
+    data = frame['data']
+    status = {
+        'is_running': True, 'is_paused': False, 'session_id': data['session_id'],
+        'stats': {key: data[key] for key in ('session_id', 'exp_gained', 'time_running', 'heals_used',
+                                              'food_used', 'attacks_made', 'creatures_killed',
+                                              'items_looted', 'items_discarded', 'created_at')},
+        'game_state': {'hp_percent': 87.5, 'mp_percent': 64.0, 'is_alive': True, 'target_creature': 'dragon'},
+        'loop_rate_hz': 3.2
+    }
+    stream = DeltaStream()
+    stream.update(status)
+    snapshot = stream.snapshot()
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        status['stats']['time_running'] += 1
+        status['game_state']['hp_percent'] = 80.0 + i % 7
+        delta = stream.update(status)
+    delta_us = (time.perf_counter() - start) / iterations * 1e6
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        binary = pack_status(i, status)
+    binary_us = (time.perf_counter() - start) / iterations * 1e6
+
+    print(f"status json snapshot: {len(snapshot)} bytes")
+    print(f"status json delta: {len(delta)} bytes, {delta_us:.1f} us/frame (diff + encode)")
+    print(f"status binary: {len(binary)} bytes, {binary_us:.1f} us/frame")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
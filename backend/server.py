@@ -1,20 +1,24 @@
 import os
-import asyncio
 import uuid
+import asyncio
 import json
+import hashlib
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, APIRouter
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, APIRouter, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import PlainTextResponse, Response
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 from pydantic import BaseModel, Field
 import logging
 from dotenv import load_dotenv
 
 from tibia_bot import TibiaBot
+from serialization import STATUS_SCHEMA, dumps
+from metrics import render_histograms, render_samples
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
@@ -49,7 +53,9 @@ app.add_middleware(
 
 # Pydantic models
 class BotConfig(BaseModel):
-    id: Optional[str] = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: Optional[str] = Field(default_factory=lambda: str(uuid.uuid4()))  # Stable across saves
+    version: int = 0  # Bumped by every write to the stored document
+    updated_at: Optional[datetime] = None
     name: str
     auto_heal: bool = True
     auto_food: bool = True
@@ -58,6 +64,7 @@ class BotConfig(BaseModel):
     auto_loot: bool = True
     heal_spell: str = "exura"
     heal_at_hp: int = 70
+    predictive_heal: bool = True  # Heal early when HP is projected to drop below heal_at_hp
     heal_mana_spell: str = "exura gran"
     heal_at_mp: int = 50
     attack_spell: str = "exori"
@@ -66,13 +73,19 @@ class BotConfig(BaseModel):
     food_hotkey: str = "F1"
     waypoints: List[Dict[str, Any]] = []
     waypoint_mode: str = "loop"  # loop, back_and_forth, once
-    waypoint_delay: int = 1000  # milliseconds between waypoints
+    waypoint_delay: int = 1000  # milliseconds between move clicks while the position is unknown
+    waypoint_tolerance: int = 1  # squares from a waypoint that count as arrived
+    waypoint_stall_timeout: int = 3000  # milliseconds without progress before clicking again
     target_creatures: List[str] = ["rat", "rotworm", "cyclops"]
     loot_items: List[str] = ["gold coin", "platinum coin", "crystal coin"]
     discard_items: List[str] = ["leather armor", "studded armor", "chain armor"]
     loot_all_and_filter: bool = True  # True for free acc, False for premium
     loot_range: int = 3  # Squares from player
     anti_idle: bool = True
+    min_loop_rate_hz: float = 0.5  # Capture/detection rate when nothing is happening
+    max_loop_rate_hz: float = 5.0  # Capture/detection rate in combat or when HP is dropping
+    cpu_budget_ms: int = 250  # Detector CPU ms per second before optional vision work is degraded
+    telemetry_rate_hz: float = 2.0  # Dashboard status updates per second, independent of the loop rate
     emergency_logout_hp: int = 10
     enabled: bool = False
 
@@ -87,43 +100,210 @@ class BotStats(BaseModel):
     creatures_killed: int = 0
     items_looted: int = 0
     items_discarded: int = 0
+    items_dropped: int = 0  # Item quantities creatures dropped, from the server log's loot messages
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Waypoint(BaseModel):
     name: str
     x: int
     y: int
+    z: Optional[int] = None  # Floor; the current floor when omitted
     description: Optional[str] = ""
 
+class WaypointImport(BaseModel):
+    waypoints: List[Waypoint]
+    replace: bool = False  # Replace the route instead of appending to it
+
 class BotCommand(BaseModel):
     command: str
     data: Optional[Dict[str, Any]] = None
 
+class ConfigCache:
+    """The active (latest saved) config, held in memory so reads never hit Mongo"""
+    
+    def __init__(self):
+        self.config: Optional[Dict[str, Any]] = None
+        self.body: Optional[str] = None
+        self.etag: Optional[str] = None
+        self.loaded = False
+    
+    async def load(self):
+        """Populate from the database (at startup, or on first use if Mongo was down then)"""
+        config = await db.bot_configs.find_one(sort=[("updated_at", -1), ("_id", -1)])
+        self.set(config)
+        self.loaded = True
+    
+    def set(self, config: Optional[Dict[str, Any]]):
+        if config is None:
+            self.config = self.body = self.etag = None
+            return
+        self.config = {key: value for key, value in config.items() if key != "_id"}
+        self.body = dumps(self.config)
+        self.etag = '"' + hashlib.sha1(self.body.encode('utf-8')).hexdigest()[:20] + '"'
+    
+    def invalidate(self):
+        """Reload from the database on the next read (after a write whose outcome is unknown)"""
+        self.loaded = False
+    
+    async def get(self) -> Optional[Dict[str, Any]]:
+        if not self.loaded:
+            await self.load()
+        return self.config
+
 # Global bot instance
 bot = TibiaBot()
+config_cache = ConfigCache()
+
+async def update_active_config(update: Dict[str, Any], match: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Versioned in-place update of the active config document, which then becomes the active config.
+    
+    Returns the updated document, or None if it (or the `match` condition) was not found.
+    Every config write keeps config_cache in step, so its ETag always matches the database.
+    """
+    update.setdefault("$set", {})["updated_at"] = datetime.utcnow()
+    update.setdefault("$inc", {})["version"] = 1
+    try:
+        config = await db.bot_configs.find_one_and_update(
+            {"id": bot.config.id, **(match or {})},
+            update,
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+    except Exception:
+        config_cache.invalidate()
+        raise
+    if config:
+        config_cache.set(config)
+        bot.config = BotConfig(**config)
+    else:
+        # Not there (or not matching) any more: whatever is cached may be stale too
+        config_cache.invalidate()
+    return config
+
+# Session fields returned by the history list unless ?fields= asks for others
+SESSION_LIST_FIELDS = [
+    "session_id", "created_at", "ended_at", "time_running", "exp_gained", "heals_used", "food_used",
+    "attacks_made", "creatures_killed", "items_looted", "items_discarded", "items_dropped"
+]
+
+def encode_session_cursor(session: Dict[str, Any]) -> str:
+    return f"{session['created_at'].isoformat()}_{session.get('session_id') or ''}"
+
+def decode_session_cursor(cursor: str):
+    created_at, _, session_id = cursor.partition("_")
+    return datetime.fromisoformat(created_at), session_id
+
+# Historical totals: rollup field -> session stats field
+ROLLUP_FIELDS = {
+    "total_time": "time_running",
+    "total_creatures": "creatures_killed",
+    "total_items": "items_looted",
+    "total_heals": "heals_used",
+    "total_attacks": "attacks_made",
+    "total_exp": "exp_gained"
+}
+ROLLUP_TOTALS_ID = "totals"
+ROLLUP_STAGING_COLLECTION = "bot_stats_rollups_rebuild"
+# Held by session saves and rollup rebuilds, so a rebuild never swaps out a concurrent increment
+rollup_lock = asyncio.Lock()
+
+def session_day(session: Dict[str, Any]) -> str:
+    return (session.get("created_at") or datetime.utcnow()).strftime("%Y-%m-%d")
+
+async def record_session_rollup(session: Dict[str, Any]):
+    """Add an ended session to the running totals and its day's bucket"""
+    increments = {"total_sessions": 1}
+    increments.update({field: int(session.get(stat) or 0) for field, stat in ROLLUP_FIELDS.items()})
+    day = session_day(session)
+    await db.bot_stats_rollups.update_one({"_id": ROLLUP_TOTALS_ID}, {"$inc": increments}, upsert=True)
+    await db.bot_stats_rollups.update_one({"_id": f"day:{day}"}, {"$inc": increments, "$set": {"day": day}}, upsert=True)
+
+async def save_session():
+    """Store the bot's session and add it to the rollups, once per session"""
+    async with rollup_lock:
+        if bot.session_saved:
+            return
+        session = bot.stats.copy()
+        session['ended_at'] = datetime.utcnow()
+        await db.bot_sessions.insert_one(session)
+        bot.session_saved = True
+        await record_session_rollup(session)
+
+async def rebuild_rollups():
+    """Recompute the totals and daily buckets with one pass over bot_sessions
+
+    Session saves wait meanwhile, so none lands in the collection being replaced.
+    """
+    async with rollup_lock:
+        sums = {field: {"$sum": f"${stat}"} for field, stat in ROLLUP_FIELDS.items()}
+        pipeline = [
+            {
+                "$group": {
+                    "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                    "total_sessions": {"$sum": 1},
+                    **sums
+                }
+            }
+        ]
+        days = await db.bot_sessions.aggregate(pipeline).to_list(None)
+        
+        totals = {"total_sessions": 0, **{field: 0 for field in ROLLUP_FIELDS}}
+        buckets = []
+        for bucket in days:
+            day = bucket.pop("_id")
+            for field in totals:
+                totals[field] += bucket.get(field) or 0
+            if day:
+                buckets.append({"_id": f"day:{day}", "day": day, **bucket})
+        
+        # Build the new rollups aside, then swap them in with one atomic rename
+        staging = db[ROLLUP_STAGING_COLLECTION]
+        await staging.drop()
+        await staging.insert_many([{"_id": ROLLUP_TOTALS_ID, **totals}, *buckets])
+        await staging.create_index("day", sparse=True)
+        await staging.rename("bot_stats_rollups", dropTarget=True)
+        return totals, len(buckets)
+
+def new_waypoint(waypoint: Waypoint) -> Dict[str, Any]:
+    waypoint_dict = waypoint.dict(exclude_none=True)
+    waypoint_dict['id'] = str(uuid.uuid4())
+    return waypoint_dict
 
 # WebSocket endpoint
 @api_router.websocket("/bot/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    bot.websocket_connections.add(websocket)
     
+    # ?encoding=binary: schema message, then packed status structs instead of JSON deltas
+    binary = websocket.query_params.get("encoding") == "binary"
+    
+    # Full snapshot first, then sequenced deltas from the telemetry ticker
+    snapshot = bot.status_snapshot()
+    bot.broadcaster.add(websocket, binary=binary)
+    if binary:
+        bot.broadcaster.send(websocket, dumps(STATUS_SCHEMA))
+        bot.broadcaster.send(websocket, bot.status_frame())
+    else:
+        bot.broadcaster.send(websocket, snapshot)
+    
+    # Replies go through the client's send queue so they never interleave with broadcasts
     try:
         while True:
             data = await websocket.receive_text()
             message = json.loads(data)
             
             if message.get("type") == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
-            elif message.get("type") == "get_status":
-                status = bot.get_status()
-                await websocket.send_text(json.dumps({
-                    "type": "status_update",
-                    "data": status
-                }))
+                bot.broadcaster.send(websocket, dumps({"type": "pong"}))
+            elif message.get("type") in ("get_status", "resync"):
+                snapshot = bot.status_snapshot()
+                bot.broadcaster.send(websocket, bot.status_frame() if binary else snapshot)
                 
     except WebSocketDisconnect:
-        bot.websocket_connections.discard(websocket)
+        pass
+    except Exception as e:
+        logger.error(f"Error in websocket connection: {e}")
+    finally:
+        bot.broadcaster.remove(websocket)
 
 # API Routes
 @api_router.get("/health")
@@ -134,35 +314,47 @@ async def health_check():
 async def save_bot_config(config: BotConfig):
     """Save bot configuration"""
     try:
-        config.id = str(uuid.uuid4())
-        config_dict = config.dict()
-        
-        # Save to database
-        await db.bot_configs.insert_one(config_dict)
+        config_dict = config.dict(exclude={"version", "updated_at"})
+        
+        # Save to database, in place under the config's stable id
+        saved = await db.bot_configs.find_one_and_update(
+            {"id": config.id},
+            {"$set": {**config_dict, "updated_at": datetime.utcnow()}, "$inc": {"version": 1}},
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        config_cache.set(saved)
         
         # Update bot configuration
-        bot.config = config
+        bot.config = BotConfig(**saved)
         
         logger.info(f"Bot configuration saved: {config.name}")
         
         return {
             "message": "Configuração salva com sucesso!",
             "config_id": config.id,
+            "version": saved["version"],
+            "config": saved,
             "timestamp": datetime.utcnow()
         }
         
     except Exception as e:
+        config_cache.invalidate()
         logger.error(f"Error saving bot config: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/bot/config")
-async def get_bot_config():
+async def get_bot_config(request: Request):
     """Get latest bot configuration"""
     try:
-        config = await db.bot_configs.find_one(sort=[("_id", -1)])
+        config = await config_cache.get()
         if config:
-            config.pop("_id", None)
-            return config
+            # Served from memory; an unchanged config is just a 304
+            headers = {"ETag": config_cache.etag, "Cache-Control": "no-cache"}
+            if request.headers.get("if-none-match") == config_cache.etag:
+                return Response(status_code=304, headers=headers)
+            return Response(content=config_cache.body, media_type="application/json", headers=headers)
         
         # Return default config if none found
         return {
@@ -187,9 +379,8 @@ async def start_bot():
         
         # Load config if not set
         if not bot.config:
-            config_data = await db.bot_configs.find_one(sort=[("_id", -1)])
+            config_data = await config_cache.get()
             if config_data:
-                config_data.pop("_id", None)
                 bot.config = BotConfig(**config_data)
             else:
                 raise HTTPException(
@@ -197,6 +388,9 @@ async def start_bot():
                     detail="Nenhuma configuração encontrada. Configure o bot primeiro."
                 )
         
+        # A session ended by an emergency logout was never stopped through the API
+        await save_session()
+        
         # Start bot
         success = bot.start()
         
@@ -219,11 +413,8 @@ async def start_bot():
 async def stop_bot():
     """Stop the bot"""
     try:
-        # Save session stats before stopping
-        if bot.stats:
-            stats_dict = bot.stats.copy()
-            stats_dict['ended_at'] = datetime.utcnow()
-            await db.bot_sessions.insert_one(stats_dict)
+        # Save session stats before stopping (also a session an emergency logout ended)
+        await save_session()
         
         # Stop bot
         bot.stop()
@@ -276,20 +467,49 @@ async def get_bot_status():
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/bot/sessions")
-async def get_bot_sessions():
-    """Get bot session history"""
+async def get_bot_sessions(before: Optional[str] = None, limit: int = Query(20, ge=1, le=100),
+                           fields: Optional[str] = None):
+    """Get bot session history, newest first.
+    
+    `before` is the `next_cursor` of the previous page; `fields` is a comma-separated
+    list of fields to return instead of the list-view defaults.
+    """
     try:
+        query: Dict[str, Any] = {}
+        if before:
+            try:
+                created_at, session_id = decode_session_cursor(before)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Cursor inválido")
+            # Keyset pagination on (created_at, session_id), served by the compound index
+            query = {"$or": [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "session_id": {"$lt": session_id}}
+            ]}
+        
+        names = [name.strip() for name in fields.split(",") if name.strip()] if fields else SESSION_LIST_FIELDS
+        projection = {name: 1 for name in names}
+        projection.update({"_id": 0, "created_at": 1, "session_id": 1})
+        
         sessions = []
-        async for session in db.bot_sessions.find().sort("created_at", -1).limit(20):
-            session.pop("_id", None)
+        cursor = db.bot_sessions.find(query, projection).sort([("created_at", -1), ("session_id", -1)]).limit(limit + 1)
+        async for session in cursor:
             sessions.append(session)
         
+        has_more = len(sessions) > limit
+        sessions = sessions[:limit]
+        next_cursor = encode_session_cursor(sessions[-1]) if has_more else None
+        
         return {
             "sessions": sessions,
             "total": len(sessions),
+            "has_more": has_more,
+            "next_cursor": next_cursor,
             "timestamp": datetime.utcnow()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting bot sessions: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -319,15 +539,14 @@ async def add_waypoint(waypoint: Waypoint):
                 detail="Nenhuma configuração carregada"
             )
         
-        # Add waypoint to current config
-        waypoint_dict = waypoint.dict()
-        waypoint_dict['id'] = str(uuid.uuid4())
-        
-        bot.config.waypoints.append(waypoint_dict)
-        
-        # Save updated config
-        config_dict = bot.config.dict()
-        await db.bot_configs.insert_one(config_dict)
+        # Append to the stored route in place
+        waypoint_dict = new_waypoint(waypoint)
+        config = await update_active_config({"$push": {"waypoints": waypoint_dict}})
+        if config is None:
+            raise HTTPException(
+                status_code=400, 
+                detail="Configuração não salva. Salve a configuração primeiro."
+            )
         
         logger.info(f"Waypoint added: {waypoint.name} at ({waypoint.x}, {waypoint.y})")
         
@@ -335,9 +554,12 @@ async def add_waypoint(waypoint: Waypoint):
             "message": "Waypoint adicionado com sucesso!",
             "waypoint": waypoint_dict,
             "total_waypoints": len(bot.config.waypoints),
+            "version": config["version"],
             "timestamp": datetime.utcnow()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error adding waypoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -352,75 +574,125 @@ async def delete_waypoint(waypoint_id: str):
                 detail="Nenhuma configuração carregada"
             )
         
-        # Find and remove waypoint
-        waypoints = bot.config.waypoints
-        original_count = len(waypoints)
-        
-        bot.config.waypoints = [wp for wp in waypoints if wp.get('id') != waypoint_id]
-        
-        if len(bot.config.waypoints) == original_count:
+        # Remove it from the stored route in place
+        config = await update_active_config(
+            {"$pull": {"waypoints": {"id": waypoint_id}}},
+            match={"waypoints.id": waypoint_id}
+        )
+        if config is None:
             raise HTTPException(
                 status_code=404, 
                 detail="Waypoint não encontrado"
             )
         
-        # Save updated config
-        config_dict = bot.config.dict()
-        await db.bot_configs.insert_one(config_dict)
-        
         logger.info(f"Waypoint deleted: {waypoint_id}")
         
         return {
             "message": "Waypoint removido com sucesso!",
             "remaining_waypoints": len(bot.config.waypoints),
+            "version": config["version"],
             "timestamp": datetime.utcnow()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error deleting waypoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/bot/waypoints/import")
+async def import_waypoints(waypoint_import: WaypointImport):
+    """Add a recorded route in one write"""
+    try:
+        if not bot.config:
+            raise HTTPException(
+                status_code=400, 
+                detail="Nenhuma configuração carregada"
+            )
+        
+        waypoints = [new_waypoint(waypoint) for waypoint in waypoint_import.waypoints]
+        if waypoint_import.replace:
+            update = {"$set": {"waypoints": waypoints}}
+        else:
+            update = {"$push": {"waypoints": {"$each": waypoints}}}
+        
+        config = await update_active_config(update)
+        if config is None:
+            raise HTTPException(
+                status_code=400, 
+                detail="Configuração não salva. Salve a configuração primeiro."
+            )
+        
+        logger.info(f"Imported {len(waypoints)} waypoints")
+        
+        return {
+            "message": f"{len(waypoints)} waypoints importados com sucesso!",
+            "imported": len(waypoints),
+            "total_waypoints": len(bot.config.waypoints),
+            "version": config["version"],
+            "timestamp": datetime.utcnow()
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error importing waypoints: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @api_router.get("/bot/statistics")
-async def get_bot_statistics():
-    """Get detailed bot statistics"""
+async def get_bot_statistics(days: int = Query(0, ge=0, le=366)):
+    """Get detailed bot statistics (`days` adds that many most recent daily buckets)"""
     try:
         # Get current session stats
         current_stats = bot.stats
         
-        # Get historical data
-        pipeline = [
-            {
-                "$group": {
-                    "_id": None,
-                    "total_sessions": {"$sum": 1},
-                    "total_time": {"$sum": "$time_running"},
-                    "total_creatures": {"$sum": "$creatures_killed"},
-                    "total_items": {"$sum": "$items_looted"},
-                    "total_heals": {"$sum": "$heals_used"},
-                    "total_attacks": {"$sum": "$attacks_made"}
-                }
-            }
-        ]
-        
-        historical_stats = await db.bot_sessions.aggregate(pipeline).to_list(1)
-        historical = historical_stats[0] if historical_stats else {}
+        # Historical totals are kept up to date when sessions end
+        historical = await db.bot_stats_rollups.find_one({"_id": ROLLUP_TOTALS_ID}, {"_id": 0}) or {}
         
-        return {
+        response = {
             "current_session": current_stats,
             "historical": historical,
             "timestamp": datetime.utcnow()
         }
         
+        if days:
+            daily = []
+            cursor = db.bot_stats_rollups.find({"day": {"$exists": True}}, {"_id": 0}).sort("day", -1).limit(days)
+            async for bucket in cursor:
+                daily.append(bucket)
+            response["daily"] = daily
+        
+        return response
+        
     except Exception as e:
         logger.error(f"Error getting bot statistics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/admin/statistics/rebuild")
+async def rebuild_statistics():
+    """Recompute the statistics rollups from the whole session history"""
+    try:
+        totals, days = await rebuild_rollups()
+        logger.info(f"Statistics rollups rebuilt: {totals['total_sessions']} sessions over {days} days")
+        
+        return {
+            "message": "Estatísticas recalculadas com sucesso!",
+            "historical": totals,
+            "days": days,
+            "timestamp": datetime.utcnow()
+        }
+        
+    except Exception as e:
+        logger.error(f"Error rebuilding statistics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @api_router.post("/bot/command")
 async def send_bot_command(command: BotCommand):
     """Send command to bot"""
     try:
         if command.command == "emergency_stop":
             bot.stop()
+            await save_session()
             return {"message": "Parada de emergência executada"}
         
         elif command.command == "reset_stats":
@@ -434,6 +706,7 @@ async def send_bot_command(command: BotCommand):
                 'creatures_killed': 0,
                 'items_looted': 0,
                 'items_discarded': 0,
+                'items_dropped': 0,
                 'created_at': datetime.utcnow()
             }
             return {"message": "Estatísticas resetadas"}
@@ -452,6 +725,81 @@ async def send_bot_command(command: BotCommand):
 # Include the router in the main app
 app.include_router(api_router)
 
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def metrics():
+    counters = [
+        (f"tibia_{name}_total", value) for name, value in bot.stats.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and name != 'time_running'
+    ]
+    lines = []
+    for name, value in counters:
+        lines.extend(render_samples(name, 'counter', f"Session {name[6:-6].replace('_', ' ')}", [({}, value)]))
+    lines.extend(render_samples('tibia_time_running_seconds', 'gauge', 'Session run time',
+                                [({}, bot.stats.get('time_running', 0))]))
+    lines.extend(render_samples('tibia_bot_running', 'gauge', 'Whether the bot is running',
+                                [({}, int(bot.is_running and not bot.is_paused))]))
+    lines.extend(render_samples('tibia_vitals_percent', 'gauge', 'Last detected HP/MP', [
+        ({'vital': 'hp'}, bot.game_state.hp_percent),
+        ({'vital': 'mp'}, bot.game_state.mp_percent)
+    ]))
+    lines.extend(render_samples('tibia_loop_rate_hz', 'gauge', 'Current loop rate', [({}, bot.governor.rate_hz)]))
+    lines.extend(render_samples('tibia_websocket_clients', 'gauge', 'Connected dashboards',
+                                [({}, len(bot.broadcaster))]))
+    lines.extend(render_histograms())
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+async def dedupe_bot_configs():
+    """Keep only the newest document per config id (older versions saved a new document on every change)"""
+    duplicates = db.bot_configs.aggregate([
+        {"$sort": {"updated_at": -1, "_id": -1}},
+        {"$group": {"_id": "$id", "keep": {"$first": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}, "_id": {"$type": "string"}}}
+    ])
+    removed = 0
+    async for group in duplicates:
+        result = await db.bot_configs.delete_many({"id": group["_id"], "_id": {"$ne": group["keep"]}})
+        removed += result.deleted_count
+    if removed:
+        config_cache.invalidate()
+        logger.info(f"Removed {removed} outdated bot config documents")
+    
+    # A non-unique index from before would clash with the unique one
+    indexes = await db.bot_configs.index_information()
+    if "id_1" in indexes and not indexes["id_1"].get("unique"):
+        await db.bot_configs.drop_index("id_1")
+
+@app.on_event("startup")
+async def create_indexes():
+    try:
+        # Session history pages newest first; sessions are also looked up by id
+        await db.bot_sessions.create_index([("created_at", -1), ("session_id", -1)])
+        await db.bot_sessions.create_index("session_id")
+        # Configs are updated in place by their stable id; the active one is the latest updated
+        await dedupe_bot_configs()
+        await db.bot_configs.create_index("id", unique=True, partialFilterExpression={"id": {"$type": "string"}})
+        await db.bot_configs.create_index([("updated_at", -1)])
+        # Daily statistics buckets are listed newest first
+        await db.bot_stats_rollups.create_index("day", sparse=True)
+    except Exception as e:
+        logger.error(f"Error creating indexes: {e}")
+
+@app.on_event("startup")
+async def ensure_statistics_rollups():
+    try:
+        # First start with existing history: build the rollups once
+        if await db.bot_stats_rollups.find_one({"_id": ROLLUP_TOTALS_ID}) is None:
+            await rebuild_rollups()
+    except Exception as e:
+        logger.error(f"Error building statistics rollups: {e}")
+
+@app.on_event("startup")
+async def load_config_cache():
+    try:
+        await config_cache.load()
+    except Exception as e:
+        logger.error(f"Error loading bot config cache: {e}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
@@ -0,0 +1,135 @@
+import re
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "12:34 Loot of a rat: 4 gold coins, cheese." / "Loot of a dragon lord: nothing."
+LOOT_RE = re.compile(r'Loot of (?:an? |the )?(?P<creature>[^:]+):\s*(?P<items>.*?)\.?$', re.IGNORECASE)
+# "12:34 You gained 150 experience points."
+EXP_RE = re.compile(r'You gained (?P<exp>[\d,.]+) experience points?', re.IGNORECASE)
+# "4 gold coins" / "a dragon ham" / "cheese"
+ITEM_RE = re.compile(r'^(?:(?P<count>\d+)\s+|an?\s+)?(?P<name>.+)$', re.IGNORECASE)
+TIMESTAMP_RE = re.compile(r'^\d{1,2}:\d{2}\s+')
+DIGITS_RE = re.compile(r'\d+')
+
+# Two OCR reads of the same line may differ in this fraction of their non-digit characters
+MAX_LINE_DISTANCE = 0.2
+
+
+@dataclass
+class LogEvent:
+    """A kill, loot or experience message from the server log"""
+    kind: str  # 'kill' or 'exp'
+    creature: Optional[str] = None
+    items: List[Tuple[int, str]] = field(default_factory=list)
+    exp: int = 0
+
+
+def parse_items(text: str) -> List[Tuple[int, str]]:
+    """'4 gold coins, a cheese' -> [(4, 'gold coins'), (1, 'cheese')]"""
+    items = []
+    text = text.strip()
+    if not text or text.lower() == 'nothing':
+        return items
+    for part in text.split(','):
+        match = ITEM_RE.match(part.strip())
+        if match and match.group('name'):
+            items.append((int(match.group('count') or 1), match.group('name').strip()))
+    return items
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance between two strings"""
+    if len(a) < len(b):
+        a, b = b, a
+    row = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        previous, row[0] = row[0], i
+        for j, cb in enumerate(b, 1):
+            previous, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, previous + (ca != cb))
+    return row[-1]
+
+
+def same_line(a: str, b: str) -> bool:
+    """Whether two OCR reads are the same log line, allowing for misread characters
+
+    Numbers (the timestamp, counts, experience) must match exactly: lines that differ
+    only there are different messages. Only the remaining text may be fuzzy.
+    """
+    if a == b:
+        return True
+    if DIGITS_RE.findall(a) != DIGITS_RE.findall(b):
+        return False
+    a, b = DIGITS_RE.sub('', a), DIGITS_RE.sub('', b)
+    longest = max(len(a), len(b))
+    if abs(len(a) - len(b)) > MAX_LINE_DISTANCE * longest:
+        return False
+    return edit_distance(a, b) <= MAX_LINE_DISTANCE * longest
+
+
+def parse_line(line: str) -> Optional[LogEvent]:
+    """Event for one server log line, or None if it is not interesting"""
+    line = TIMESTAMP_RE.sub('', line.strip())
+
+    match = LOOT_RE.search(line)
+    if match:
+        return LogEvent(kind='kill', creature=match.group('creature').strip().lower(),
+                        items=parse_items(match.group('items')))
+
+    match = EXP_RE.search(line)
+    if match:
+        return LogEvent(kind='exp', exp=int(re.sub(r'[,.]', '', match.group('exp'))))
+
+    return None
+
+
+class ServerLogParser:
+    """Turns successive reads of the server log panel into events for the new lines only.
+
+    The panel shows the last N lines and scrolls up; each read is aligned with the
+    previous one (longest suffix of the old read that is a prefix of the new one,
+    comparing lines by normalized edit distance since OCR misreads a few characters)
+    so lines already seen are never counted twice. Reads are only taken when the
+    panel's pixels changed, so at least one line is always new: a read identical to
+    the previous one means a repeated message scrolled in. A read sharing no line with
+    the previous one cannot be aligned and is dropped rather than counted again. The
+    first read only primes the parser: whatever was already on the panel is history.
+    """
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.primed = False
+
+    def new_lines(self, lines: List[str]) -> List[str]:
+        lines = [line.strip() for line in lines if line.strip()]
+        previous = self.lines
+        overlap = 0
+        for k in range(min(len(previous), len(lines) - 1), 0, -1):
+            if all(same_line(old, new) for old, new in zip(previous[-k:], lines[:k])):
+                overlap = k
+                break
+        self.lines = lines
+        if previous and lines and not overlap:
+            logger.debug("Server log read does not overlap the previous one, skipping it")
+            return []
+        return lines[overlap:]
+
+    def feed(self, text: str) -> List[LogEvent]:
+        """Parse a fresh OCR read of the panel"""
+        lines = self.new_lines(text.splitlines())
+        if not self.primed:
+            self.primed = True
+            return []
+
+        events = []
+        for line in lines:
+            event = parse_line(line)
+            if event:
+                events.append(event)
+        return events
+
+    def reset(self):
+        self.lines = []
+        self.primed = False
@@ -0,0 +1,250 @@
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import fft as sp_fft
+
+logger = logging.getLogger(__name__)
+
+# BGR -> luma weights, same as cv2.COLOR_BGR2GRAY
+BGR_LUMA = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+
+def make_placeholder_sprite(color: Tuple[int, int, int], size: Tuple[int, int] = (16, 16)) -> np.ndarray:
+    """Build a grayscale stand-in sprite (textured body, dark outline), deterministic per color"""
+    w, h = size
+    r, g, b = color
+    body = 0.299 * r + 0.587 * g + 0.114 * b
+    rng = np.random.default_rng((r << 16) | (g << 8) | b)
+    sprite = np.clip(body + rng.normal(0, 40, (h, w)), 0, 255).astype(np.float32)
+    sprite[0, :] = sprite[-1, :] = sprite[:, 0] = sprite[:, -1] = body * 0.3
+    return sprite
+
+
+class FFTTemplateBank:
+    """Batched normalized cross-correlation of a whole sprite bank in the frequency domain.
+
+    Templates are made zero-mean/unit-norm once and padded to a common size; their
+    spectra are cached per FFT shape, so matching a frame costs one forward FFT of the
+    frame plus one batched inverse FFT, regardless of how many sprites are in the bank.
+    Matching is thread-safe: the lazily filled caches are guarded by a lock.
+    """
+
+    def __init__(self, sprites: Dict[str, np.ndarray], thresholds: Optional[Dict[str, float]] = None,
+                 default_threshold: float = 0.85):
+        thresholds = thresholds or {}
+        self.names: List[str] = list(sprites)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.shapes = [tuple(sprites[name].shape[:2]) for name in self.names]
+        self.thresholds = np.array(
+            [thresholds.get(name, default_threshold) for name in self.names], dtype=np.float32
+        )
+
+        th = max((s[0] for s in self.shapes), default=1)
+        tw = max((s[1] for s in self.shapes), default=1)
+        self.kernel_shape = (th, tw)
+        self.kernels = np.zeros((len(self.names), th, tw), dtype=np.float32)
+
+        for i, name in enumerate(self.names):
+            kernel = self._prepare_kernel(sprites[name])
+            self.kernels[i, :kernel.shape[0], :kernel.shape[1]] = kernel
+
+        self._spectra: Dict[Tuple[int, int], np.ndarray] = {}
+        self._pyramid: Dict[int, 'FFTTemplateBank'] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @staticmethod
+    def _prepare_kernel(sprite: np.ndarray) -> np.ndarray:
+        """Grayscale, zero-mean, unit-norm version of a sprite"""
+        sprite = np.asarray(sprite, dtype=np.float32)
+        if sprite.ndim == 3:
+            sprite = sprite[:, :, :3] @ BGR_LUMA
+        kernel = sprite - sprite.mean()
+        norm = np.linalg.norm(kernel)
+        if norm > 0:
+            kernel /= norm
+        return kernel
+
+    @staticmethod
+    def _template_sprite(template: Dict, default_size: Tuple[int, int]) -> np.ndarray:
+        sprite = template.get('sprite')
+        if sprite is None:
+            sprite = make_placeholder_sprite(template['color'], template.get('size', default_size))
+        return sprite
+
+    def subset(self, names: Iterable[str]) -> 'FFTTemplateBank':
+        """A smaller bank sharing this bank's prepared kernels (spectra are recomputed lazily)"""
+        keep = [self.index[n] for n in dict.fromkeys(names) if n in self.index]
+        bank = FFTTemplateBank.__new__(FFTTemplateBank)
+        bank.names = [self.names[i] for i in keep]
+        bank.index = {name: i for i, name in enumerate(bank.names)}
+        bank.shapes = [self.shapes[i] for i in keep]
+        bank.thresholds = self.thresholds[keep]
+        bank.kernel_shape = self.kernel_shape
+        bank.kernels = self.kernels[keep]
+        with self._lock:
+            bank._spectra = {shape: spectra[keep] for shape, spectra in self._spectra.items()}
+        bank._pyramid = {}
+        bank._lock = threading.Lock()
+        return bank
+
+    def downscaled(self, level: int) -> 'FFTTemplateBank':
+        """The bank at pyramid `level` (sprites shrunk by 2**level), built once and cached"""
+        if level <= 0:
+            return self
+        with self._lock:
+            bank = self._pyramid.get(level)
+            if bank is None:
+                factor = 2 ** level
+                sprites = {}
+                for i, name in enumerate(self.names):
+                    h, w = self.shapes[i]
+                    h2, w2 = max(1, h // factor), max(1, w // factor)
+                    kernel = self.kernels[i, :h2 * factor, :w2 * factor]
+                    sprites[name] = kernel.reshape(h2, factor, w2, factor).mean(axis=(1, 3))
+                bank = FFTTemplateBank(sprites, dict(zip(self.names, self.thresholds.tolist())))
+                self._pyramid[level] = bank
+        return bank
+
+    def updated(self, templates: Dict[str, Dict], removed: Iterable[str] = (),
+                default_size: Tuple[int, int] = (16, 16), default_threshold: float = 0.85) -> 'FFTTemplateBank':
+        """A new bank with `templates` added/replaced and `removed` dropped.
+
+        Only the changed kernels (and their rows of every cached spectrum) are
+        recomputed; everything else is copied from this bank, which stays valid.
+        """
+        removed = set(removed) | set(templates)
+        kept = [self.index[n] for n in self.names if n not in removed]
+        changed = {name: self._prepare_kernel(self._template_sprite(t, default_size))
+                   for name, t in templates.items()}
+
+        bank = FFTTemplateBank.__new__(FFTTemplateBank)
+        bank.names = [self.names[i] for i in kept] + list(changed)
+        bank.index = {name: i for i, name in enumerate(bank.names)}
+        bank.shapes = [self.shapes[i] for i in kept] + [k.shape for k in changed.values()]
+        bank.thresholds = np.concatenate([
+            self.thresholds[kept],
+            np.array([t.get('threshold', default_threshold) for t in templates.values()], dtype=np.float32)
+        ])
+
+        th = max((s[0] for s in bank.shapes), default=1)
+        tw = max((s[1] for s in bank.shapes), default=1)
+        bank.kernel_shape = (th, tw)
+        bank.kernels = np.zeros((len(bank.names), th, tw), dtype=np.float32)
+        for row, i in enumerate(kept):
+            h, w = self.shapes[i]
+            bank.kernels[row, :h, :w] = self.kernels[i, :h, :w]
+        for row, kernel in enumerate(changed.values(), start=len(kept)):
+            bank.kernels[row, :kernel.shape[0], :kernel.shape[1]] = kernel
+
+        # Zero padding does not change a spectrum, so unchanged rows carry over as-is
+        bank._pyramid = {}
+        bank._spectra = {}
+        bank._lock = threading.Lock()
+        new_rows = bank.kernels[len(kept):]
+        with self._lock:
+            cached = list(self._spectra.items())
+        for shape, spectra in cached:
+            fresh = np.conj(sp_fft.rfft2(new_rows, s=shape, axes=(-2, -1)))
+            bank._spectra[shape] = np.concatenate([spectra[kept], fresh])
+        return bank
+
+    @classmethod
+    def from_templates(cls, templates: Dict[str, Dict], default_size: Tuple[int, int] = (16, 16)) -> 'FFTTemplateBank':
+        """Build a bank from detector template dicts ('sprite', or 'color' + 'size', optional 'threshold')"""
+        sprites = {}
+        thresholds = {}
+        for name, template in templates.items():
+            sprites[name] = cls._template_sprite(template, default_size)
+            if 'threshold' in template:
+                thresholds[name] = template['threshold']
+        return cls(sprites, thresholds)
+
+    def _spectrum(self, fft_shape: Tuple[int, int]) -> np.ndarray:
+        """Conjugated spectra of all kernels for a given FFT shape (computed once per shape)"""
+        with self._lock:
+            spectra = self._spectra.get(fft_shape)
+            if spectra is None:
+                spectra = np.conj(sp_fft.rfft2(self.kernels, s=fft_shape, axes=(-2, -1)))
+                self._spectra[fft_shape] = spectra
+        return spectra
+
+    def match(self, image: np.ndarray, names: Optional[Iterable[str]] = None,
+              max_matches: int = 4) -> List[Tuple[str, int, int, float]]:
+        """Correlate a grayscale image against the bank.
+
+        Returns (name, x, y, score) tuples, where (x, y) is the center of the match
+        in image coordinates.
+        """
+        if not self.names or image is None or image.size == 0:
+            return []
+
+        gray = np.asarray(image, dtype=np.float32)
+        if gray.ndim == 3:
+            gray = gray[:, :, :3] @ BGR_LUMA
+        height, width = gray.shape
+
+        if names is None:
+            selected = list(range(len(self.names)))
+        else:
+            selected = [self.index[n] for n in names if n in self.index]
+        selected = [i for i in selected if self.shapes[i][0] <= height and self.shapes[i][1] <= width]
+        if not selected:
+            return []
+
+        fft_shape = (sp_fft.next_fast_len(height, real=True), sp_fft.next_fast_len(width, real=True))
+        frame_spectrum = sp_fft.rfft2(gray, s=fft_shape)
+        spectra = self._spectrum(fft_shape)[selected]
+        correlation = sp_fft.irfft2(spectra * frame_spectrum[None], s=fft_shape, axes=(-2, -1))
+
+        # Integral images for the per-window energy of the frame
+        integral = np.zeros((height + 1, width + 1), dtype=np.float64)
+        integral[1:, 1:] = gray.cumsum(0).cumsum(1)
+        integral_sq = np.zeros((height + 1, width + 1), dtype=np.float64)
+        integral_sq[1:, 1:] = (gray.astype(np.float64) ** 2).cumsum(0).cumsum(1)
+        window_energy: Dict[Tuple[int, int], np.ndarray] = {}
+
+        matches = []
+        for row, i in enumerate(selected):
+            th, tw = self.shapes[i]
+            energy = window_energy.get((th, tw))
+            if energy is None:
+                sums = (integral[th:, tw:] - integral[:-th, tw:]
+                        - integral[th:, :-tw] + integral[:-th, :-tw])
+                sums_sq = (integral_sq[th:, tw:] - integral_sq[:-th, tw:]
+                           - integral_sq[th:, :-tw] + integral_sq[:-th, :-tw])
+                energy = np.sqrt(np.maximum(sums_sq - sums * sums / (th * tw), 0.0))
+                window_energy[(th, tw)] = energy
+
+            valid = correlation[row, :height - th + 1, :width - tw + 1]
+            scores = np.where(energy > 1e-3, valid / np.maximum(energy, 1e-3), 0.0)
+
+            ys, xs = np.nonzero(scores >= self.thresholds[i])
+            if len(ys) == 0:
+                continue
+            order = np.argsort(scores[ys, xs])[::-1]
+
+            # Greedy non-maximum suppression within the sprite footprint
+            kept: List[Tuple[int, int]] = []
+            for k in order:
+                y, x = int(ys[k]), int(xs[k])
+                if any(abs(y - ky) < th and abs(x - kx) < tw for ky, kx in kept):
+                    continue
+                kept.append((y, x))
+                matches.append((self.names[i], x + tw // 2, y + th // 2, float(scores[y, x])))
+                if len(kept) >= max_matches:
+                    break
+
+        # Only the best sprite survives at any one spot
+        matches.sort(key=lambda m: m[3], reverse=True)
+        best: List[Tuple[str, int, int, float]] = []
+        for match in matches:
+            th, tw = self.shapes[self.index[match[0]]]
+            if any(abs(match[1] - x) < tw // 2 and abs(match[2] - y) < th // 2 for _, x, y, _ in best):
+                continue
+            best.append(match)
+        return best
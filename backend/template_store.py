@@ -0,0 +1,231 @@
+import os
+import sys
+import json
+import uuid
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+STORE_VERSION = 2
+
+# Template directory layout: one sub-directory per kind, one image per template
+TEMPLATE_KINDS = {'creatures': 'creature', 'items': 'item'}
+METADATA_FILE = 'metadata.json'
+
+
+class TemplateStore:
+    """Packed, memory-mapped sprite library.
+
+    A data file holds every sprite back to back as raw uint8 pixels; `<base>.json`
+    is the index (data file name, then name, kind, offset, shape, metadata per
+    sprite). Sprites are returned as read-only views into the memory map, so opening
+    a store is instant and the pages are shared by every bot process reading the
+    same file.
+
+    Each pack writes a new `<base>.<token>.bin` and then swaps in the index that
+    points to it, so readers see either the old or the new store, never a mix, and
+    a data file that is still mapped (which Windows cannot replace) is never
+    overwritten.
+    """
+
+    def __init__(self, base_path: str):
+        self.base_path = str(base_path)
+        with open(self.base_path + '.json', 'r', encoding='utf-8') as f:
+            index = json.load(f)
+
+        if index.get('version') not in (1, STORE_VERSION):
+            raise ValueError(f"Unsupported template store version: {index.get('version')}")
+
+        self.entries: Dict[str, Dict[str, Any]] = {entry['name']: entry for entry in index['entries']}
+        # Version 1 stores always used `<base>.bin`
+        self.data_path = self.data_file(self.base_path, index.get('data'))
+        size = os.path.getsize(self.data_path)
+        if size:
+            self.data = np.memmap(self.data_path, dtype=np.uint8, mode='r', shape=(size,))
+        else:
+            self.data = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def data_file(base_path: str, name: Optional[str] = None) -> str:
+        """Path of a data file named in the index (they live next to it)"""
+        if not name:
+            return base_path + '.bin'
+        return os.path.join(os.path.dirname(os.path.abspath(base_path)), name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def names(self, kind: Optional[str] = None) -> List[str]:
+        return [name for name, entry in self.entries.items() if kind is None or entry['kind'] == kind]
+
+    def sprite(self, name: str) -> np.ndarray:
+        """Zero-copy view of a sprite"""
+        entry = self.entries[name]
+        shape = tuple(entry['shape'])
+        count = int(np.prod(shape))
+        return self.data[entry['offset']:entry['offset'] + count].reshape(shape)
+
+    def meta(self, name: str) -> Dict[str, Any]:
+        return self.entries[name].get('meta', {})
+
+    def templates(self, kind: str) -> Dict[str, Dict[str, Any]]:
+        """Detector-style template dicts ({'sprite': ..., 'size': ..., **meta}) for one kind"""
+        templates = {}
+        for name in self.names(kind):
+            sprite = self.sprite(name)
+            templates[name] = {
+                **self.meta(name),
+                'sprite': sprite,
+                'size': (sprite.shape[1], sprite.shape[0])
+            }
+        return templates
+
+    @staticmethod
+    def pack(base_path: str, entries: Iterable[Tuple[str, str, np.ndarray, Dict[str, Any]]]) -> int:
+        """Write (name, kind, sprite, meta) entries into a new data file + `<base>.json`"""
+        index = []
+        offset = 0
+        data_name = f"{os.path.basename(base_path)}.{uuid.uuid4().hex[:12]}.bin"
+        data_path = TemplateStore.data_file(base_path, data_name)
+        tmp_json = base_path + '.json.tmp'
+
+        with open(data_path, 'wb') as f:
+            for name, kind, sprite, meta in entries:
+                pixels = np.ascontiguousarray(sprite, dtype=np.uint8)
+                f.write(pixels.tobytes())
+                index.append({
+                    'name': name,
+                    'kind': kind,
+                    'offset': offset,
+                    'shape': list(pixels.shape),
+                    'meta': meta or {}
+                })
+                offset += pixels.size
+
+        with open(tmp_json, 'w', encoding='utf-8') as f:
+            json.dump({'version': STORE_VERSION, 'data': data_name, 'entries': index}, f, separators=(',', ':'))
+
+        # The index is the only file replaced, so the swap is a single atomic rename
+        os.replace(tmp_json, base_path + '.json')
+        TemplateStore.remove_stale(base_path, data_name)
+        return len(index)
+
+    @staticmethod
+    def remove_stale(base_path: str, keep: str):
+        """Best-effort removal of data files from earlier packs (ones still mapped elsewhere may stay)"""
+        directory = os.path.dirname(os.path.abspath(base_path))
+        prefix = os.path.basename(base_path) + '.'
+        for name in os.listdir(directory):
+            if name == keep or not name.startswith(prefix) or not name.endswith('.bin'):
+                continue
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError as e:
+                logger.debug(f"Keeping old template data file {name}: {e}")
+
+
+def load_sprite(path: Path) -> np.ndarray:
+    """Read a sprite image as BGR uint8 (the channel order of captured frames)"""
+    with Image.open(path) as image:
+        rgb = np.array(image.convert('RGB'), dtype=np.uint8)
+    return np.ascontiguousarray(rgb[:, :, ::-1])
+
+
+def template_name(path: Path) -> str:
+    """'gold_coin.png' -> 'gold coin'"""
+    return path.stem.replace('_', ' ').lower()
+
+
+def scan_template_dir(directory: str) -> Iterator[Tuple[str, str, Path, Dict[str, Any]]]:
+    """Yield (name, kind, image path, meta) for every sprite in a template directory"""
+    root = Path(directory)
+    metadata: Dict[str, Dict[str, Any]] = {}
+    if (root / METADATA_FILE).exists():
+        with open(root / METADATA_FILE, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+
+    for folder, kind in TEMPLATE_KINDS.items():
+        if not (root / folder).is_dir():
+            continue
+        for path in sorted((root / folder).glob('*.png')):
+            name = template_name(path)
+            yield name, kind, path, metadata.get(name, {})
+
+
+def pack_directory(directory: str, base_path: str) -> int:
+    """Pack a template directory into a store"""
+    return TemplateStore.pack(base_path, (
+        (name, kind, load_sprite(path), meta) for name, kind, path, meta in scan_template_dir(directory)
+    ))
+
+
+class TemplateWatcher:
+    """Polls a template directory and reports added/changed and removed templates.
+
+    The callback receives ({name: (kind, path, meta)}, {removed names}) and runs on
+    the watcher thread; it must not touch state the bot loop is reading.
+    """
+
+    def __init__(self, directory: str, callback: Callable[[Dict[str, Tuple[str, Path, Dict[str, Any]]], Set[str]], None],
+                 interval: float = 2.0):
+        self.directory = directory
+        self.callback = callback
+        self.interval = interval
+        self.snapshot: Dict[str, Tuple] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def scan(self) -> Tuple[Dict[str, Tuple[str, Path, Dict[str, Any]]], Set[str]]:
+        """Diff the directory against the last scan"""
+        current = {}
+        entries = {}
+        for name, kind, path, meta in scan_template_dir(self.directory):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            current[name] = (kind, str(path), stat.st_mtime_ns, stat.st_size, json.dumps(meta, sort_keys=True))
+            entries[name] = (kind, path, meta)
+
+        changed = {name: entries[name] for name, key in current.items() if self.snapshot.get(name) != key}
+        removed = set(self.snapshot) - set(current)
+        self.snapshot = current
+        return changed, removed
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='template-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                changed, removed = self.scan()
+                if changed or removed:
+                    self.callback(changed, removed)
+            except Exception as e:
+                logger.error(f"Error watching templates in {self.directory}: {e}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python template_store.py <templates_dir> <store_base_path>")
+        sys.exit(1)
+
+    logging.basicConfig(level=logging.INFO)
+    count = pack_directory(sys.argv[1], sys.argv[2])
+    logger.info(f"Packed {count} templates into {sys.argv[2]}.json")
@@ -4,20 +4,43 @@ import threading
 import time
 import random
 import uuid
-import json
 import numpy as np
-from PIL import Image, ImageDraw, ImageEnhance
+from PIL import Image
 import psutil
-from scipy import interpolate
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple, Any
+from types import MappingProxyType
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
 import logging
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
+from pathlib import Path
+
+from pathfinding import Pathfinder, WaypointIndex, load_pathfinder
+from pipeline import Pipeline, Stage
+from position_locator import MinimapLocator
+from server_log import LogEvent, ServerLogParser
+from broadcaster import Broadcaster, DeltaStream
+from metrics import (ACTION_LATENCY_SECONDS, CAPTURE_SECONDS, DETECTOR_SECONDS, LOOP_TICK_SECONDS,
+                     OCR_SECONDS)
+from serialization import pack_status
+from template_bank import FFTTemplateBank
+from template_store import TemplateStore, TemplateWatcher, load_sprite
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Packed template library (<base>.json + the data file it names), built with template_store.py
+TEMPLATE_STORE_PATH = os.environ.get('TEMPLATE_STORE', str(Path(__file__).parent / 'template_store'))
+
+# Template directory (creatures/*.png, items/*.png, metadata.json), hot-reloaded while running
+TEMPLATES_DIR = os.environ.get('TEMPLATES_DIR', str(Path(__file__).parent / 'templates'))
+TEMPLATE_RELOAD_INTERVAL = float(os.environ.get('TEMPLATE_RELOAD_INTERVAL', '2.0'))
+
+# Prebuilt world-map atlas used to locate the player from the minimap
+MAP_ATLAS_DIR = os.environ.get('MAP_ATLAS_DIR', str(Path(__file__).parent / 'map_atlas'))
+
 # Set environment for headless operation
 os.environ.setdefault('DISPLAY', ':0')
 
@@ -51,6 +74,7 @@ class MockCV2:
     COLOR_RGB2BGR = 4
     COLOR_BGR2GRAY = 6
     COLOR_BGRA2BGR = 3
+    COLOR_BGR2HSV = 40
     
     def cvtColor(self, img, code):
         if len(img.shape) == 3:
@@ -141,6 +165,15 @@ class Creature:
     distance: int
     health: int = 100
 
+@dataclass
+class KillRecord:
+    """Represents a recent kill (corpse) on screen"""
+    name: str
+    x: int
+    y: int
+    timestamp: float
+    scans: int = 0
+
 @dataclass
 class LootItem:
     """Represents a loot item"""
@@ -150,6 +183,307 @@ class LootItem:
     value: int = 0
     keep: bool = True
 
+class FrameCache:
+    """Lazily derived representations of one captured frame, shared by all detectors
+    
+    Each intermediate (HSV or grayscale of an ROI, pyramid levels) is computed at
+    most once per frame, on first request, even when detectors run on different
+    threads. ROIs requested with an enclosing `area` are views cut out of the one
+    conversion of that area, so neighbouring ROIs (the HP and MP bars, overlapping
+    corpse regions) share it. Call release() when the frame is retired.
+    """
+    
+    def __init__(self, image: np.ndarray, frame_id: int = 0):
+        self.image = image
+        self.frame_id = frame_id
+        self._cache: Dict[Any, Any] = {}
+        self._locks: Dict[Any, threading.Lock] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key, factory: Callable[[], Any]) -> Any:
+        """Cached value for `key`, computing it with `factory` the first time"""
+        value = self._cache.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            value = self._cache.get(key)
+            if value is None:
+                value = factory()
+                self._cache[key] = value
+        return value
+    
+    @staticmethod
+    def union(rois: List[Tuple[int, int, int, int]]) -> Tuple[int, int, int, int]:
+        """Smallest (top, bottom, left, right) area containing all `rois`"""
+        return (min(r[0] for r in rois), max(r[1] for r in rois),
+                min(r[2] for r in rois), max(r[3] for r in rois))
+    
+    @staticmethod
+    def crop(image: np.ndarray, roi: Tuple[int, int, int, int], area: Tuple[int, int, int, int]) -> np.ndarray:
+        """View of `roi` inside an image of the enclosing `area`"""
+        return image[roi[0] - area[0]:roi[1] - area[0], roi[2] - area[2]:roi[3] - area[2]]
+    
+    def roi(self, roi: Optional[Tuple[int, int, int, int]] = None) -> np.ndarray:
+        """View of the frame for a (top, bottom, left, right) area (no copy)"""
+        if roi is None:
+            return self.image
+        top, bottom, left, right = roi
+        return self.image[top:bottom, left:right]
+    
+    def hsv(self, roi: Optional[Tuple[int, int, int, int]] = None,
+            area: Optional[Tuple[int, int, int, int]] = None) -> np.ndarray:
+        if area is not None and roi is not None and roi != area:
+            return self.crop(self.hsv(area), roi, area)
+        return self.get(('hsv', roi), lambda: cv2.cvtColor(self.roi(roi), cv2.COLOR_BGR2HSV))
+    
+    def gray(self, roi: Optional[Tuple[int, int, int, int]] = None,
+             area: Optional[Tuple[int, int, int, int]] = None) -> np.ndarray:
+        if area is not None and roi is not None and roi != area:
+            return self.crop(self.gray(area), roi, area)
+        return self.get(('gray', roi), lambda: cv2.cvtColor(self.roi(roi), cv2.COLOR_BGR2GRAY))
+    
+    def pyramid(self, level: int, roi: Optional[Tuple[int, int, int, int]] = None,
+                area: Optional[Tuple[int, int, int, int]] = None) -> np.ndarray:
+        """Grayscale at 1 / 2**level resolution, each level derived from the one above"""
+        if level <= 0:
+            return self.gray(roi, area)
+        
+        def downscale():
+            upper = np.asarray(self.pyramid(level - 1, roi, area), dtype=np.float32)
+            h, w = upper.shape[0] // 2, upper.shape[1] // 2
+            return upper[:h * 2, :w * 2].reshape(h, 2, w, 2).mean(axis=(1, 3))
+        
+        return self.get(('pyramid', level, roi), downscale)
+    
+    def release(self):
+        """Drop the frame and everything derived from it"""
+        self._cache.clear()
+        self._locks.clear()
+        self.image = None
+
+class VitalsTrend:
+    """Short ring buffer of timestamped GameState samples with an HP trend estimate"""
+    
+    def __init__(self, window: float = 4.0, maxlen: int = 32):
+        self.window = window  # Seconds of history used for the trend
+        self.samples = deque(maxlen=maxlen)
+    
+    def add(self, state: GameState, now: float = None):
+        self.samples.append((time.time() if now is None else now, state))
+    
+    def clear(self):
+        self.samples.clear()
+    
+    def hp_rate(self, now: float = None) -> float:
+        """HP change in percent per second (negative while taking damage), by least squares"""
+        if now is None:
+            now = time.time()
+        recent = [(t, s.hp_percent) for t, s in self.samples if now - t <= self.window]
+        if len(recent) < 3:
+            return 0.0
+        t = np.array([r[0] for r in recent])
+        hp = np.array([r[1] for r in recent])
+        t -= t.mean()
+        variance = (t * t).sum()
+        if variance <= 0:
+            return 0.0
+        return float((t * (hp - hp.mean())).sum() / variance)
+    
+    def time_to_hp(self, threshold: float, now: float = None) -> Optional[float]:
+        """Seconds until HP is projected to reach `threshold`, or None if it is not dropping"""
+        if not self.samples:
+            return None
+        hp = self.samples[-1][1].hp_percent
+        if hp <= threshold:
+            return 0.0
+        rate = self.hp_rate(now)
+        if rate >= 0:
+            return None
+        return (hp - threshold) / -rate
+
+class ActivityGovernor:
+    """Chooses the capture/detection rate from game activity, between a floor and a ceiling rate"""
+    
+    def __init__(self, min_rate_hz: float = 0.5, max_rate_hz: float = 5.0, half_life: float = 3.0):
+        self.min_rate_hz = min_rate_hz
+        self.max_rate_hz = max_rate_hz
+        self.half_life = half_life  # Seconds for activity to halve once things calm down
+        self.activity = 0.0         # 0 = idle at a safe spot, 1 = fighting
+        self.last_update = time.time()
+    
+    @property
+    def rate_hz(self) -> float:
+        return self.min_rate_hz + (self.max_rate_hz - self.min_rate_hz) * self.activity
+    
+    def update(self, level: float, now: float = None) -> float:
+        """Report this tick's activity level (0..1); returns seconds to wait before the next tick
+        
+        Activity jumps up immediately and decays smoothly, so the rate reacts
+        at once to danger but does not flap between ticks.
+        """
+        if now is None:
+            now = time.time()
+        decay = 0.5 ** ((now - self.last_update) / self.half_life)
+        self.activity = max(min(1.0, level), self.activity * decay)
+        self.last_update = now
+        return 1.0 / max(self.rate_hz, 1e-3)
+
+class CPUBudget:
+    """Per-instance budget of detector CPU time (ms per second) with graceful degradation
+    
+    Degradation levels, applied to optional vision work only (vitals are never throttled):
+      0 - full quality
+      1 - loot rescans every 2nd tick (a corpse's first scan is never delayed)
+      2 - loot rescans every 4th tick, detection ROIs shrunk towards the player or corpse
+      3 - loot rescans every 8th tick, smaller ROIs and matching one pyramid level down
+    """
+    
+    LOOT_SCAN_EVERY = (1, 2, 4, 8)
+    ROI_SCALE = (1.0, 1.0, 0.75, 0.6)
+    PYRAMID_LEVEL = (0, 0, 0, 1)
+    
+    def __init__(self, budget_ms: float = 250.0, window: float = 1.0):
+        self.budget_ms = budget_ms
+        self.window = window
+        self.level = 0
+        self.samples = deque()       # (timestamp, cpu seconds)
+        self.stage_costs: Dict[str, float] = {}  # EMA of CPU ms per stage
+        # Pipeline workers record costs while the event loop reads them
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def measure(self, stage: str):
+        """Charge the CPU time of the enclosed block to `stage`"""
+        start = time.thread_time()
+        try:
+            yield
+        finally:
+            cost = time.thread_time() - start
+            with self._lock:
+                self.samples.append((time.time(), cost))
+                previous = self.stage_costs.get(stage)
+                self.stage_costs[stage] = cost * 1000 if previous is None else 0.8 * previous + 0.2 * cost * 1000
+    
+    def used_ms(self, now: float = None) -> float:
+        """Detector CPU ms spent per second over the last window"""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            while self.samples and now - self.samples[0][0] > self.window:
+                self.samples.popleft()
+            return sum(cost for _, cost in self.samples) * 1000 / self.window
+    
+    def stage_ms(self) -> Dict[str, float]:
+        """Snapshot of the per-stage CPU cost EMAs"""
+        with self._lock:
+            return dict(self.stage_costs)
+    
+    def update(self, now: float = None) -> int:
+        """Step the degradation level up when over budget, back down when comfortably under"""
+        used = self.used_ms(now)
+        if used > self.budget_ms and self.level < 3:
+            self.level += 1
+        elif used < 0.6 * self.budget_ms and self.level > 0:
+            self.level -= 1
+        return self.level
+    
+    @property
+    def loot_scan_every(self) -> int:
+        return self.LOOT_SCAN_EVERY[self.level]
+    
+    @property
+    def roi_scale(self) -> float:
+        return self.ROI_SCALE[self.level]
+    
+    @property
+    def pyramid_level(self) -> int:
+        return self.PYRAMID_LEVEL[self.level]
+
+# Size in pixels of one game square on screen
+TILE_SIZE = 32
+
+class KillIndex:
+    """Spatial index of recent kill positions, bucketed by game square"""
+    
+    def __init__(self, ttl: float = 10.0, loot_delay: float = 0.4, max_scans: int = 2):
+        self.min_ttl = ttl
+        self.ttl = ttl                # Seconds a corpse stays eligible for looting
+        self.loot_delay = loot_delay  # Seconds to wait for the corpse to appear
+        self.max_scans = max_scans    # Loot scans per corpse before giving up
+        self.cells: Dict[Tuple[int, int], KillRecord] = {}
+    
+    def __len__(self) -> int:
+        return len(self.cells)
+    
+    def fit_ttl(self, scan_period: float):
+        """Keep corpses long enough for every scan when scans are `scan_period` seconds apart"""
+        self.ttl = max(self.min_ttl, self.loot_delay + self.max_scans * scan_period)
+    
+    @staticmethod
+    def cell_of(x: int, y: int) -> Tuple[int, int]:
+        return (x // TILE_SIZE, y // TILE_SIZE)
+    
+    def add(self, name: str, x: int, y: int, now: float = None):
+        """Record a kill; a newer kill on the same square replaces the old one"""
+        if now is None:
+            now = time.time()
+        self.cells[self.cell_of(x, y)] = KillRecord(name=name, x=x, y=y, timestamp=now)
+    
+    def prune(self, now: float = None):
+        """Drop expired or exhausted corpses"""
+        if now is None:
+            now = time.time()
+        expired = [cell for cell, kill in self.cells.items()
+                   if now - kill.timestamp > self.ttl or kill.scans >= self.max_scans]
+        for cell in expired:
+            del self.cells[cell]
+    
+    def pending(self, now: float = None) -> List[KillRecord]:
+        """Corpses that are ready to be scanned for loot"""
+        if now is None:
+            now = time.time()
+        self.prune(now)
+        return [kill for kill in self.cells.values() if now - kill.timestamp >= self.loot_delay]
+    
+    def unscanned(self, now: float = None) -> bool:
+        """Whether a pending corpse has not been scanned yet"""
+        return any(kill.scans == 0 for kill in self.pending(now))
+    
+    def query(self, x: int, y: int, radius: int = 1) -> List[KillRecord]:
+        """Corpses within `radius` squares of a screen position"""
+        cx, cy = self.cell_of(x, y)
+        found = []
+        for dx in range(-radius, radius + 1):
+            for dy in range(-radius, radius + 1):
+                kill = self.cells.get((cx + dx, cy + dy))
+                if kill:
+                    found.append(kill)
+        return found
+    
+    def loot_regions(self, now: float = None, radius: int = 1) -> List[Tuple[int, int, int, int]]:
+        """Screen regions (top, bottom, left, right) around pending corpses, marked as scanned"""
+        regions = []
+        for kill in self.pending(now):
+            kill.scans += 1
+            cx, cy = self.cell_of(kill.x, kill.y)
+            regions.append((
+                max(0, (cy - radius) * TILE_SIZE),
+                (cy + radius + 1) * TILE_SIZE,
+                max(0, (cx - radius) * TILE_SIZE),
+                (cx + radius + 1) * TILE_SIZE
+            ))
+        return regions
+    
+    def consume(self, x: int, y: int, radius: int = 1):
+        """Forget corpses around a looted position"""
+        for kill in self.query(x, y, radius):
+            self.cells.pop(self.cell_of(kill.x, kill.y), None)
+    
+    def clear(self):
+        self.cells.clear()
+
 class TibiaDetector:
     """Handles all Tibia game detection and screen analysis"""
     
@@ -164,7 +498,18 @@ class TibiaDetector:
         self.last_screenshot = None
         self.hp_area = None
         self.mp_area = None
-        self.chat_area = None
+        self.chat_area = (640, 780, 10, 900)  # Server log panel: top, bottom, left, right
+        self.chat_digest = None
+        self.server_log = ServerLogParser()
+        self.hp_roi = (20, 40, 150, 300)  # top, bottom, left, right
+        self.mp_roi = (45, 65, 150, 300)
+        self.minimap_area = (30, 136, 1090, 1196)  # top, bottom, left, right (1 pixel per tile)
+        self.player_screen_pos = (600, 350)  # Center of the game area, where the character stands
+        
+        # Quality knobs lowered by the CPU budget governor
+        self.roi_scale = 1.0      # Fraction of the creature/loot search areas kept around the player
+        self.pyramid_level = 0    # Template matching resolution (0 = full, 1 = half, ...)
+        self.last_position: Optional[Tuple[int, int, int]] = None
         
         # Color thresholds for different game elements
         self.hp_color_ranges = {
@@ -172,8 +517,24 @@ class TibiaDetector:
             'red': ([0, 50, 50], [10, 255, 255])     # HSV for low HP
         }
         
+        # Headless/demo mode: nothing real to look at, so detections are simulated
+        self.simulated = self.sct is None and isinstance(pyautogui, MockPyAutoGUI)
+        
         self.creature_templates = {}
         self.loot_templates = {}
+        self.template_store = None
+        self.template_watcher = None
+        self.position_locator = None
+        if os.path.exists(os.path.join(MAP_ATLAS_DIR, 'atlas.json')):
+            try:
+                self.position_locator = MinimapLocator(MAP_ATLAS_DIR)
+            except Exception as e:
+                logger.error(f"Error loading map atlas: {e}")
+        self._pending_templates = None
+        self._templates_lock = threading.Lock()
+        # Pipeline stages run on worker threads while API requests may capture or locate too
+        self._capture_lock = threading.Lock()
+        self._position_lock = threading.Lock()
         self.load_templates()
     
     def load_templates(self):
@@ -194,8 +555,74 @@ class TibiaDetector:
             'crystal coin': {'color': (0, 255, 255), 'value': 10000},
             'small ruby': {'color': (255, 0, 0), 'value': 250},
             'small emerald': {'color': (0, 255, 0), 'value': 250},
-            'small sapphire': {'color': (0, 0, 255), 'value': 250}
+            'small sapphire': {'color': (0, 0, 255), 'value': 250},
+            'leather armor': {'color': (139, 90, 43), 'value': 5, 'size': (24, 24)},
+            'studded armor': {'color': (112, 84, 62), 'value': 25, 'size': (24, 24)},
+            'chain armor': {'color': (169, 169, 169), 'value': 70, 'size': (24, 24)}
         }
+        
+        # Real sprites from the packed store (memory-mapped) override the placeholders
+        if os.path.exists(TEMPLATE_STORE_PATH + '.json'):
+            try:
+                self.template_store = TemplateStore(TEMPLATE_STORE_PATH)
+                self.creature_templates.update(self.template_store.templates('creature'))
+                for name, template in self.template_store.templates('item').items():
+                    template.setdefault('value', 0)
+                    self.loot_templates[name] = template
+                logger.info(f"Loaded {len(self.template_store)} templates from {TEMPLATE_STORE_PATH}")
+            except Exception as e:
+                logger.error(f"Error loading template store: {e}")
+        
+        # Loose sprites in the templates directory override everything and are hot-reloaded
+        if os.path.isdir(TEMPLATES_DIR):
+            self.template_watcher = TemplateWatcher(TEMPLATES_DIR, self.reload_templates, TEMPLATE_RELOAD_INTERVAL)
+            changed, removed = self.template_watcher.scan()
+            if changed:
+                self.reload_templates(changed, removed)
+                self.apply_template_reload()
+            self.template_watcher.start()
+    
+    def reload_templates(self, changed: Dict[str, Tuple[str, Any, Dict]], removed: set):
+        """Rebuild only the changed template entries; the result is swapped in by apply_template_reload"""
+        start = time.perf_counter()
+        
+        with self._templates_lock:
+            if self._pending_templates:
+                creature_templates, loot_templates = self._pending_templates
+            else:
+                creature_templates, loot_templates = self.creature_templates, self.loot_templates
+        
+        # Unchanged entries keep their dicts, which is how RuntimePlan.compile tells them apart
+        creature_templates = dict(creature_templates)
+        loot_templates = dict(loot_templates)
+        
+        for name, (kind, path, meta) in changed.items():
+            sprite = load_sprite(path)
+            template = {**meta, 'sprite': sprite, 'size': (sprite.shape[1], sprite.shape[0])}
+            if kind == 'creature':
+                creature_templates[name] = template
+            else:
+                template.setdefault('value', 0)
+                loot_templates[name] = template
+        
+        for name in removed:
+            creature_templates.pop(name, None)
+            loot_templates.pop(name, None)
+        
+        with self._templates_lock:
+            self._pending_templates = (creature_templates, loot_templates)
+        
+        logger.info(f"Templates reloaded: {len(changed)} changed, {len(removed)} removed "
+                    f"in {(time.perf_counter() - start) * 1000:.1f}ms")
+    
+    def apply_template_reload(self) -> bool:
+        """Swap in a pending template reload; call between frames"""
+        with self._templates_lock:
+            pending, self._pending_templates = self._pending_templates, None
+        if not pending:
+            return False
+        self.creature_templates, self.loot_templates = pending
+        return True
     
     def find_tibia_window(self) -> Optional[Dict]:
         """Find the Tibia game window"""
@@ -232,6 +659,7 @@ class TibiaDetector:
             logger.error(f"Error finding Tibia window: {e}")
             return None
     
+    @CAPTURE_SECONDS.timed()
     def capture_screen(self) -> Optional[np.ndarray]:
         """Capture the current screen/game area"""
         try:
@@ -251,7 +679,8 @@ class TibiaDetector:
                     'height': self.tibia_window['height']
                 }
                 
-                screenshot = self.sct.grab(monitor)
+                with self._capture_lock:
+                    screenshot = self.sct.grab(monitor)
                 img = np.array(screenshot)
                 
                 # Convert BGRA to BGR
@@ -261,7 +690,8 @@ class TibiaDetector:
                 return img
             else:
                 # Use pyautogui as fallback
-                screenshot = pyautogui.screenshot()
+                with self._capture_lock:
+                    screenshot = pyautogui.screenshot()
                 img = np.array(screenshot)
                 img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
                 self.last_screenshot = img
@@ -272,18 +702,23 @@ class TibiaDetector:
             # Return a mock screenshot for testing
             return np.zeros((600, 800, 3), dtype=np.uint8)
     
-    def detect_hp_mp(self, screenshot: np.ndarray) -> GameState:
+    @DETECTOR_SECONDS.timed('hp_mp')
+    def detect_hp_mp(self, screenshot: np.ndarray, frame: Optional[FrameCache] = None) -> GameState:
         """Detect HP and MP from screenshot using OCR and color analysis"""
         try:
             game_state = GameState()
+            if frame is None:
+                frame = FrameCache(screenshot)
             
             # Define HP/MP bar areas (these would be calibrated for actual Tibia client)
-            hp_area = screenshot[20:40, 150:300]  # Example coordinates
-            mp_area = screenshot[45:65, 150:300]  # Example coordinates
+            hp_area = frame.roi(self.hp_roi)
+            mp_area = frame.roi(self.mp_roi)
+            vitals_area = FrameCache.union([self.hp_roi, self.mp_roi])
             
             # Use OCR to read HP/MP text
-            hp_text = pytesseract.image_to_string(hp_area, config='--psm 8 -c tessedit_char_whitelist=0123456789/')
-            mp_text = pytesseract.image_to_string(mp_area, config='--psm 8 -c tessedit_char_whitelist=0123456789/')
+            with OCR_SECONDS.time('hp_mp'):
+                hp_text = pytesseract.image_to_string(hp_area, config='--psm 8 -c tessedit_char_whitelist=0123456789/')
+                mp_text = pytesseract.image_to_string(mp_area, config='--psm 8 -c tessedit_char_whitelist=0123456789/')
             
             # Parse HP
             if '/' in hp_text:
@@ -303,10 +738,10 @@ class TibiaDetector:
             
             # If OCR fails, use color analysis as fallback
             if game_state.hp_percent == 100.0:
-                game_state.hp_percent = self.analyze_hp_bar_color(hp_area)
+                game_state.hp_percent = self.analyze_hp_bar_color(hp_area, frame.hsv(self.hp_roi, vitals_area))
             
             if game_state.mp_percent == 100.0:
-                game_state.mp_percent = self.analyze_mp_bar_color(mp_area)
+                game_state.mp_percent = self.analyze_mp_bar_color(mp_area, frame.hsv(self.mp_roi, vitals_area))
             
             game_state.is_alive = game_state.hp_percent > 0
             
@@ -316,11 +751,12 @@ class TibiaDetector:
             logger.error(f"Error detecting HP/MP: {e}")
             return GameState()
     
-    def analyze_hp_bar_color(self, hp_area: np.ndarray) -> float:
+    def analyze_hp_bar_color(self, hp_area: np.ndarray, hsv: Optional[np.ndarray] = None) -> float:
         """Analyze HP bar color to estimate HP percentage"""
         try:
-            # Convert to HSV for better color analysis
-            hsv = cv2.cvtColor(hp_area, cv2.COLOR_BGR2HSV)
+            # Convert to HSV for better color analysis (unless the frame cache already did)
+            if hsv is None:
+                hsv = cv2.cvtColor(hp_area, cv2.COLOR_BGR2HSV)
             
             # Count green pixels (healthy HP)
             green_mask = cv2.inRange(hsv, np.array([40, 40, 40]), np.array([80, 255, 255]))
@@ -341,11 +777,12 @@ class TibiaDetector:
             logger.error(f"Error analyzing HP bar color: {e}")
             return 100.0
     
-    def analyze_mp_bar_color(self, mp_area: np.ndarray) -> float:
+    def analyze_mp_bar_color(self, mp_area: np.ndarray, hsv: Optional[np.ndarray] = None) -> float:
         """Analyze MP bar color to estimate MP percentage"""
         try:
-            # Convert to HSV
-            hsv = cv2.cvtColor(mp_area, cv2.COLOR_BGR2HSV)
+            # Convert to HSV (unless the frame cache already did)
+            if hsv is None:
+                hsv = cv2.cvtColor(mp_area, cv2.COLOR_BGR2HSV)
             
             # Count blue pixels (MP)
             blue_mask = cv2.inRange(hsv, np.array([100, 50, 50]), np.array([130, 255, 255]))
@@ -359,32 +796,40 @@ class TibiaDetector:
             logger.error(f"Error analyzing MP bar color: {e}")
             return 100.0
     
-    def detect_creatures(self, screenshot: np.ndarray, target_list: List[str]) -> List[Creature]:
-        """Detect creatures on screen using template matching"""
+    @DETECTOR_SECONDS.timed('creatures')
+    def detect_creatures(self, screenshot: np.ndarray, target_list: List[str],
+                         templates: Optional[Mapping[str, Dict]] = None) -> List[Creature]:
+        """Detect creatures on screen using template matching
+        
+        `templates` is an optional pre-filtered sub-bank (see RuntimePlan); when given,
+        `target_list` is not probed against the full template dict.
+        """
         creatures = []
         
         try:
             # Game area where creatures appear (center of screen typically)
-            game_area = screenshot[100:600, 300:900]
-            
-            for creature_name in target_list:
-                if creature_name in self.creature_templates:
-                    template = self.creature_templates[creature_name]
+            top, bottom, left, right = self.scale_roi((100, 600, 300, 900))
+            game_area = screenshot[top:bottom, left:right]
+            
+            if templates is None:
+                templates = {name: self.creature_templates[name]
+                             for name in target_list if name in self.creature_templates}
+            
+            for creature_name, template in templates.items():
+                # In a real implementation, you'd use template matching
+                # For demo, we'll simulate creature detection
+                if random.random() < 0.15:  # 15% chance to detect each creature
+                    x = random.randint(left, right - 1)
+                    y = random.randint(top, bottom - 1)
+                    distance = random.randint(1, 7)
                     
-                    # In a real implementation, you'd use template matching
-                    # For demo, we'll simulate creature detection
-                    if random.random() < 0.15:  # 15% chance to detect each creature
-                        x = random.randint(300, 850)
-                        y = random.randint(150, 550)
-                        distance = random.randint(1, 7)
-                        
-                        creatures.append(Creature(
-                            name=creature_name,
-                            x=x,
-                            y=y,
-                            distance=distance,
-                            health=random.randint(50, 100)
-                        ))
+                    creatures.append(Creature(
+                        name=creature_name,
+                        x=x,
+                        y=y,
+                        distance=distance,
+                        health=random.randint(50, 100)
+                    ))
             
             # Sort by distance (closest first)
             creatures.sort(key=lambda c: c.distance)
@@ -395,30 +840,74 @@ class TibiaDetector:
             logger.error(f"Error detecting creatures: {e}")
             return []
     
-    def detect_loot(self, screenshot: np.ndarray, loot_list: List[str]) -> List[LootItem]:
-        """Detect loot items on screen"""
+    @DETECTOR_SECONDS.timed('loot')
+    def detect_loot(self, screenshot: np.ndarray, loot_list: Iterable[str],
+                    regions: Optional[List[Tuple[int, int, int, int]]] = None,
+                    templates: Optional[Mapping[str, Dict]] = None,
+                    bank: Optional[FFTTemplateBank] = None,
+                    frame: Optional[FrameCache] = None) -> List[LootItem]:
+        """Detect loot items on screen, optionally only inside (top, bottom, left, right) regions
+        
+        `templates` and `bank` are an optional pre-filtered sub-bank (see RuntimePlan).
+        """
         loot_items = []
         
         try:
-            # Area around player where loot appears
-            loot_area = screenshot[200:500, 400:800]
+            if frame is None:
+                frame = FrameCache(screenshot)
             
-            for item_name in loot_list:
-                if item_name in self.loot_templates:
-                    template = self.loot_templates[item_name]
-                    
-                    # Simulate loot detection
-                    if random.random() < 0.08:  # 8% chance to detect each item
-                        x = random.randint(400, 750)
-                        y = random.randint(250, 450)
-                        
-                        loot_items.append(LootItem(
-                            name=item_name,
-                            x=x,
-                            y=y,
-                            value=template['value'],
-                            keep=True
-                        ))
+            # Area around player where loot appears; corpse regions shrink around the corpse
+            if regions is None:
+                regions = [self.scale_roi((200, 500, 400, 800))]
+            else:
+                regions = [self.scale_roi(region, center=((region[2] + region[3]) // 2, (region[0] + region[1]) // 2),
+                                          min_size=TILE_SIZE)
+                           for region in regions]
+            
+            if templates is None:
+                templates = {name: self.loot_templates[name]
+                             for name in loot_list if name in self.loot_templates}
+            if bank is None:
+                bank = FFTTemplateBank.from_templates(dict(templates))
+            
+            # Overlapping corpse regions share one grayscale conversion, unless they are far apart
+            area = FrameCache.union(regions) if regions else None
+            if area and ((area[1] - area[0]) * (area[3] - area[2]) >
+                         2 * sum((r[1] - r[0]) * (r[3] - r[2]) for r in regions)):
+                area = None
+            
+            for top, bottom, left, right in regions:
+                loot_area = frame.roi((top, bottom, left, right))
+                if loot_area.size == 0:
+                    continue
+                
+                if self.simulated:
+                    for item_name, template in templates.items():
+                        # Simulate loot detection
+                        if random.random() < 0.08:  # 8% chance to detect each item
+                            x = random.randint(left, left + loot_area.shape[1] - 1)
+                            y = random.randint(top, top + loot_area.shape[0] - 1)
+                            
+                            loot_items.append(LootItem(
+                                name=item_name,
+                                x=x,
+                                y=y,
+                                value=template['value'],
+                                keep=True
+                            ))
+                    continue
+                
+                # Correlate the whole loot bank against the area in one pass
+                gray = frame.pyramid(self.pyramid_level, (top, bottom, left, right), area)
+                factor = 2 ** self.pyramid_level
+                for item_name, x, y, score in bank.downscaled(self.pyramid_level).match(gray):
+                    loot_items.append(LootItem(
+                        name=item_name,
+                        x=left + x * factor,
+                        y=top + y * factor,
+                        value=templates[item_name]['value'],
+                        keep=True
+                    ))
             
             return loot_items
             
@@ -426,17 +915,132 @@ class TibiaDetector:
             logger.error(f"Error detecting loot: {e}")
             return []
     
-    def get_current_position(self) -> Tuple[int, int]:
-        """Get current player position (for waypoint system)"""
+    @DETECTOR_SECONDS.timed('server_log')
+    def read_server_log(self, screenshot: np.ndarray, frame: Optional[FrameCache] = None) -> List[LogEvent]:
+        """Kill/loot/exp events from lines that appeared in the server log since the last read"""
         try:
-            # In a real implementation, this would read from memory or analyze minimap
-            # For demo, we'll return simulated coordinates
-            return (random.randint(1000, 1100), random.randint(1000, 1100))
+            if frame is None:
+                frame = FrameCache(screenshot)
+            
+            # Only OCR the panel when its pixels changed
+            digest = hash(frame.roi(self.chat_area).tobytes())
+            if digest == self.chat_digest:
+                return []
+            self.chat_digest = digest
+            
+            with OCR_SECONDS.time('server_log'):
+                text = pytesseract.image_to_string(frame.gray(self.chat_area), config='--psm 6')
+            return self.server_log.feed(text)
+            
+        except Exception as e:
+            logger.error(f"Error reading server log: {e}")
+            return []
+    
+    def scale_roi(self, roi: Tuple[int, int, int, int], center: Optional[Tuple[int, int]] = None,
+                  min_size: int = 0) -> Tuple[int, int, int, int]:
+        """Shrink a (top, bottom, left, right) area by roi_scale towards `center` (default: the player)"""
+        if self.roi_scale >= 1.0:
+            return roi
+        top, bottom, left, right = roi
+        px, py = center or self.player_screen_pos
+        top, bottom = py - (py - top) * self.roi_scale, py + (bottom - py) * self.roi_scale
+        left, right = px - (px - left) * self.roi_scale, px + (right - px) * self.roi_scale
+        if bottom - top < min_size:
+            top, bottom = py - min_size / 2, py + min_size / 2
+        if right - left < min_size:
+            left, right = px - min_size / 2, px + min_size / 2
+        return (max(0, int(top)), int(bottom), max(0, int(left)), int(right))
+    
+    def tile_to_screen(self, position: Tuple[int, int, int], tile: Tuple[int, int, int]) -> Tuple[int, int]:
+        """Screen pixel at the center of a world tile, relative to the player's tile"""
+        px, py = self.player_screen_pos
+        return (px + (tile[0] - position[0]) * TILE_SIZE, py + (tile[1] - position[1]) * TILE_SIZE)
+    
+    @DETECTOR_SECONDS.timed('position')
+    def locate(self, screenshot: Optional[np.ndarray] = None) -> Optional[Tuple[int, int, int]]:
+        """World (x, y, z) from the minimap, or the last known one; None without a map atlas
+        
+        Safe to call from the pipeline and an API request at the same time.
+        """
+        if self.position_locator is None:
+            return None
+        if screenshot is None:
+            screenshot = self.last_screenshot if self.last_screenshot is not None else self.capture_screen()
+        
+        top, bottom, left, right = self.minimap_area
+        with self._position_lock:
+            position = self.position_locator.locate(screenshot[top:bottom, left:right])
+            if position is not None:
+                self.last_position = position
+            return self.last_position
+    
+    def get_current_position(self, screenshot: Optional[np.ndarray] = None) -> Tuple[int, int]:
+        """Get current player position (for waypoint system) by locating the minimap on the map atlas"""
+        try:
+            if self.position_locator is None:
+                # No atlas available: simulated coordinates for the demo
+                return (random.randint(1000, 1100), random.randint(1000, 1100))
+            
+            position = self.locate(screenshot)
+            if position is None:
+                return (1000, 1000)
+            return position[:2]
             
         except Exception as e:
             logger.error(f"Error getting current position: {e}")
             return (1000, 1000)
 
+@dataclass(frozen=True)
+class RuntimePlan:
+    """Immutable lookups compiled once from a BotConfig for the hot loop"""
+    target_creatures: FrozenSet[str]
+    loot_items: FrozenSet[str]
+    discard_items: FrozenSet[str]
+    creature_templates: Mapping[str, Dict]  # Only the active targets
+    loot_templates: Mapping[str, Dict]      # Only the items we pick up
+    loot_values: Mapping[str, int]          # Pickup order, most valuable first
+    loot_bank: FFTTemplateBank
+    
+    @classmethod
+    def compile(cls, config, detector: TibiaDetector, previous: Optional['RuntimePlan'] = None) -> 'RuntimePlan':
+        """Build the plan for a config against the detector's current template library
+        
+        With the `previous` plan, its loot bank is updated with only the templates that
+        were added, replaced or dropped, keeping the other kernels and cached spectra.
+        """
+        target_creatures = frozenset(config.target_creatures)
+        discard_items = frozenset(config.discard_items)
+        loot_items = frozenset(config.loot_items)
+        
+        # In loot-all-and-filter mode the discard items are picked up and dropped later
+        wanted = list(config.loot_items)
+        if config.loot_all_and_filter:
+            wanted += [name for name in config.discard_items if name not in loot_items]
+        
+        creature_templates = {name: detector.creature_templates[name]
+                              for name in config.target_creatures if name in detector.creature_templates}
+        loot_templates = {name: detector.loot_templates[name]
+                          for name in wanted if name in detector.loot_templates}
+        
+        # Only the plan's own sprites are read (the store is memory-mapped)
+        if previous is None:
+            loot_bank = FFTTemplateBank.from_templates(loot_templates)
+        else:
+            old = previous.loot_templates
+            changed = {name: t for name, t in loot_templates.items() if old.get(name) is not t}
+            removed = [name for name in old if name not in loot_templates]
+            loot_bank = previous.loot_bank.updated(changed, removed) if changed or removed else previous.loot_bank
+        
+        return cls(
+            target_creatures=target_creatures,
+            loot_items=loot_items,
+            discard_items=discard_items,
+            creature_templates=MappingProxyType(creature_templates),
+            loot_templates=MappingProxyType(loot_templates),
+            loot_values=MappingProxyType({name: t['value'] for name, t in loot_templates.items()}),
+            loot_bank=loot_bank
+        )
+
 class TibiaAutomation:
     """Handles all automation actions (mouse, keyboard, spells)"""
     
@@ -450,6 +1054,13 @@ class TibiaAutomation:
             'micro_pause_chance': 0.15,
             'micro_pause_duration': (0.05, 0.3)
         }
+        # perf_counter() of the frame the current actions were decided on
+        self.frame_time: Optional[float] = None
+    
+    def record_action(self, action: str):
+        """Observe the capture-to-input latency of an action"""
+        if self.frame_time is not None:
+            ACTION_LATENCY_SECONDS.observe(time.perf_counter() - self.frame_time, action)
         
     def human_delay(self, min_delay: float = None, max_delay: float = None):
         """Generate human-like delay with micro-pauses"""
@@ -503,6 +1114,7 @@ class TibiaAutomation:
                 time.sleep(random.uniform(*self.human_delays['typing_delay']))
             
             pyautogui.press('enter')
+            self.record_action('spell')
             logger.info(f"Cast spell: {spell}")
             
         except Exception as e:
@@ -513,6 +1125,7 @@ class TibiaAutomation:
         try:
             self.human_delay(0.1, 0.2)
             pyautogui.press(hotkey)
+            self.record_action('hotkey')
             logger.info(f"Used hotkey: {hotkey}")
             
         except Exception as e:
@@ -533,6 +1146,7 @@ class TibiaAutomation:
                 pyautogui.click()
             elif button == 'right':
                 pyautogui.rightClick()
+            self.record_action('click')
             
             logger.info(f"Clicked at ({x}, {y}) with {button} button")
             
@@ -624,9 +1238,11 @@ class TibiaBot:
         self.is_running = False
         self.is_paused = False
         self.session_id = str(uuid.uuid4())
+        self.session_saved = True  # Whether this session is in the history (nothing to save yet)
         
-        # Configuration
-        self.config = None
+        # Configuration (setting it compiles self.plan)
+        self._config = None
+        self.plan: Optional[RuntimePlan] = None
         
         # Statistics
         self.stats = {
@@ -639,6 +1255,7 @@ class TibiaBot:
             'creatures_killed': 0,
             'items_looted': 0,
             'items_discarded': 0,
+            'items_dropped': 0,
             'created_at': datetime.utcnow()
         }
         
@@ -646,50 +1263,178 @@ class TibiaBot:
         self.current_waypoint_index = 0
         self.waypoint_direction = 1
         self.last_waypoint_time = 0
+        self.leg_start: Optional[Tuple[int, int, int]] = None
+        self.leg_started_at: Optional[float] = None
+        self.leg_step: Optional[Tuple[int, int, int]] = None  # Tile the last move click targeted
+        self.leg_best_distance = float('inf')
+        self.leg_progress_time = 0.0
+        self.waypoint_legs = deque(maxlen=50)  # Recent legs with their travel time
+        
+        # Pathfinding over the map atlas (None when no atlas is installed)
+        self.pathfinder = load_pathfinder(MAP_ATLAS_DIR)
         
-        # WebSocket connections for real-time updates
-        self.websocket_connections = set()
+        # Spatial index over config.waypoints, rebuilt when the route changes
+        self.waypoint_index: Optional[WaypointIndex] = None
+        self.waypoint_index_key = None
+        self.in_combat = False
+        
+        # WebSocket clients for real-time updates (sends never block the bot loop)
+        self.broadcaster = Broadcaster()
+        self.status_stream = DeltaStream()
+        self.telemetry_task: Optional[asyncio.Task] = None
         
         # Game state
         self.game_state = GameState()
         
+        # Recent kills, used to scan for loot only around fresh corpses
+        self.kill_index = KillIndex()
+        self.last_target: Optional[Creature] = None
+        
+        # HP history for predictive healing, and how long it takes to act on a decision
+        self.vitals = VitalsTrend()
+        self.loop_interval = 1.0   # EMA of seconds between HP samples
+        self.heal_latency = 0.5    # EMA of seconds taken to cast a heal
+        self.time_to_heal: Optional[float] = None
+        
+        # Loop rate follows game activity
+        self.governor = ActivityGovernor()
+        
+        # Detector CPU budget shared with other instances on the host
+        self.cpu_budget = CPUBudget()
+        self.loot_tick = 0
+        
+        # Detection stages, run as a DAG by main_loop
+        self.pipeline = self.build_pipeline()
+        
+    def build_pipeline(self) -> Pipeline:
+        """Declare the detection stages and what each one needs"""
+        minimap = lambda frame: frame.roi(self.detector.minimap_area).tobytes() if frame else None
+        return Pipeline([
+            Stage('capture', self._stage_capture, outputs=('screenshot',)),
+            Stage('frame', self._stage_frame, inputs=('screenshot',), outputs=('frame',)),
+            Stage('vitals', self._stage_vitals, inputs=('screenshot', 'frame'), outputs=('game_state',)),
+            Stage('creatures', self._stage_creatures, inputs=('screenshot',), outputs=('creatures',),
+                  enabled=lambda: self.config.auto_attack),
+            # Throttling only delays rescans: a fresh corpse could expire before a throttled tick
+            Stage('loot', self._stage_loot, inputs=('screenshot', 'frame'), outputs=('loot_items',),
+                  enabled=lambda: (self.config.auto_loot and bool(self.kill_index) and
+                                   (self.loot_tick % self.cpu_budget.loot_scan_every == 0 or
+                                    self.kill_index.unscanned()))),
+            Stage('server_log', self._stage_server_log, inputs=('screenshot', 'frame'), outputs=('log_events',)),
+            # Skipped when the minimap did not change since the last tick
+            Stage('position', self._stage_position, inputs=('frame',), outputs=('position',),
+                  enabled=lambda: bool(self.config.auto_walk and self.config.waypoints),
+                  key=minimap)
+        ])
+    
+    def _stage_capture(self):
+        with self.cpu_budget.measure('capture'):
+            screenshot = self.detector.capture_screen()
+        self.automation.frame_time = time.perf_counter()
+        return screenshot
+    
+    def _stage_frame(self, screenshot):
+        # Intermediates (HSV, grayscale, pyramids) shared by all detectors this frame
+        return FrameCache(screenshot) if screenshot is not None else None
+    
+    def _stage_vitals(self, screenshot, frame):
+        if screenshot is None:
+            return None
+        # Never throttled
+        with self.cpu_budget.measure('vitals'):
+            return self.detector.detect_hp_mp(screenshot, frame)
+    
+    def _stage_creatures(self, screenshot):
+        if screenshot is None:
+            return []
+        with self.cpu_budget.measure('creatures'):
+            return self.detector.detect_creatures(
+                screenshot, self.plan.target_creatures, self.plan.creature_templates
+            )
+    
+    def _stage_loot(self, screenshot, frame):
+        # Only around recent corpses, less often when over the CPU budget
+        loot_regions = self.kill_index.loot_regions()
+        if screenshot is None or not loot_regions:
+            return []
+        with self.cpu_budget.measure('loot'):
+            items = self.detector.detect_loot(
+                screenshot, self.plan.loot_items, loot_regions,
+                self.plan.loot_templates, self.plan.loot_bank, frame
+            )
+        # Most valuable first, in case the corpse decays or a fight starts mid-loot
+        values = self.plan.loot_values
+        return sorted(items, key=lambda item: values.get(item.name, 0), reverse=True)
+    
+    def _stage_server_log(self, screenshot, frame):
+        if screenshot is None:
+            return []
+        with self.cpu_budget.measure('server_log'):
+            return self.detector.read_server_log(screenshot, frame)
+    
+    def _stage_position(self, frame):
+        if frame is None:
+            return None
+        with self.cpu_budget.measure('position'):
+            return self.detector.locate(frame.image)
+    
+    @property
+    def config(self):
+        return self._config
+    
+    @config.setter
+    def config(self, config):
+        self._config = config
+        self.refresh_plan()
+    
+    def refresh_plan(self):
+        """Recompile the runtime plan after the config or template library changed"""
+        self.plan = RuntimePlan.compile(self._config, self.detector, self.plan) if self._config else None
+    
     def update_stats(self, stat_name: str, value: int = 1):
         """Update bot statistics"""
         if stat_name in self.stats:
             self.stats[stat_name] += value
     
-    async def broadcast_stats(self):
-        """Broadcast current stats to all connected websockets"""
-        if self.websocket_connections:
-            stats_data = {
-                "type": "stats_update",
-                "data": {
-                    **self.stats,
-                    "is_running": self.is_running,
-                    "is_paused": self.is_paused,
-                    "game_state": {
-                        "hp_percent": self.game_state.hp_percent,
-                        "mp_percent": self.game_state.mp_percent,
-                        "is_alive": self.game_state.is_alive,
-                        "target_creature": self.game_state.target_creature
-                    }
-                }
-            }
-            
-            disconnected = set()
-            for websocket in self.websocket_connections:
-                try:
-                    await websocket.send_text(json.dumps(stats_data))
-                except:
-                    disconnected.add(websocket)
-            
-            # Remove disconnected websockets
-            self.websocket_connections -= disconnected
+    def register_kill(self, creature_name: str):
+        """Count a kill and remember where the corpse is, if it was our target"""
+        self.update_stats('creatures_killed')
+        target = self.last_target
+        if target and target.name == creature_name:
+            self.kill_index.add(target.name, target.x, target.y)
+            self.last_target = None
+        if self.game_state.target_creature == creature_name:
+            self.game_state.target_creature = None
+    
+    def broadcast_stats(self):
+        """Publish what changed in the status to all connected websockets"""
+        if self.broadcaster:
+            delta = self.status_stream.update(self.get_status())
+            if delta:
+                # Serialized once per tick; a client that missed a delta gets a snapshot instead
+                binary = self.status_frame() if self.broadcaster.has_binary() else None
+                self.broadcaster.publish(delta, fallback=self.status_stream.snapshot, binary=binary)
+    
+    def status_snapshot(self) -> str:
+        """Full status frame for a client that connects or asks for a resync"""
+        self.broadcast_stats()
+        if not self.broadcaster:
+            self.status_stream.update(self.get_status())
+        return self.status_stream.snapshot()
+    
+    def status_frame(self) -> bytes:
+        """Binary status frame (see serialization.STATUS_SCHEMA) at the current sequence number"""
+        return pack_status(self.status_stream.seq, self.status_stream.state)
     
     async def main_loop(self):
-        """Main bot execution loop"""
+        """Main bot execution loop
+        
+        Input actions sleep for human-like timing, so they run in a worker thread
+        and the event loop (telemetry, websockets, API) keeps going meanwhile.
+        """
         logger.info("Bot main loop started")
         start_time = time.time()
+        await asyncio.to_thread(self.resume_nearest_waypoint)
         
         while self.is_running:
             try:
@@ -697,82 +1442,132 @@ class TibiaBot:
                     await asyncio.sleep(1)
                     continue
                 
+                tick_start = time.perf_counter()
+                
                 # Update running time
                 self.stats['time_running'] = int(time.time() - start_time)
                 
-                # Capture screen
-                screenshot = self.detector.capture_screen()
-                if screenshot is None:
-                    await asyncio.sleep(1)
-                    continue
+                # Swap in hot-reloaded templates between frames
+                if self.detector.apply_template_reload():
+                    self.refresh_plan()
                 
-                # Detect game state
-                self.game_state = self.detector.detect_hp_mp(screenshot)
+                # Degrade optional vision work when over the CPU budget
+                self.cpu_budget.update()
+                self.detector.roi_scale = self.cpu_budget.roi_scale
+                self.detector.pyramid_level = self.cpu_budget.pyramid_level
                 
-                # Emergency logout
-                if self.game_state.hp_percent <= self.config.emergency_logout_hp:
-                    logger.warning("Emergency logout triggered!")
-                    self.is_running = False
+                # Run the detection stages (independent ones in parallel)
+                self.loot_tick += 1
+                detections = await asyncio.to_thread(self.pipeline.run)
+                if not self.is_running:
                     break
-                
-                # Auto heal
-                if (self.config.auto_heal and 
-                    self.game_state.hp_percent <= self.config.heal_at_hp):
-                    self.automation.cast_spell(self.config.heal_spell)
-                    self.update_stats('heals_used')
-                
-                # Auto mana
-                if (self.config.auto_heal and 
-                    self.game_state.mp_percent <= self.config.heal_at_mp):
-                    self.automation.cast_spell(self.config.heal_mana_spell)
-                    self.update_stats('heals_used')
-                
-                # Auto food
-                if self.config.auto_food and random.random() < 0.05:  # 5% chance per cycle
-                    self.automation.use_food()
-                    self.update_stats('food_used')
-                
-                # Auto attack
-                if self.config.auto_attack:
-                    creatures = self.detector.detect_creatures(screenshot, self.config.target_creatures)
-                    if creatures:
-                        target = creatures[0]  # Attack closest creature
-                        self.automation.attack_creature(target, self.config.attack_spell)
-                        self.update_stats('attacks_made')
-                        
-                        # Chance to kill creature
-                        if random.random() < 0.3:
-                            self.update_stats('creatures_killed')
-                            self.game_state.target_creature = None
-                        else:
+                screenshot = detections['screenshot']
+                if screenshot is None:
+                    await asyncio.sleep(1)
+                    continue
+                frame = detections['frame']
+                try:
+                    
+                    self.game_state = detections['game_state'] or GameState()
+                    now = time.time()
+                    if self.vitals.samples:
+                        self.loop_interval = 0.8 * self.loop_interval + 0.2 * (now - self.vitals.samples[-1][0])
+                    self.vitals.add(self.game_state, now)
+                    self.time_to_heal = self.vitals.time_to_hp(self.config.heal_at_hp, now)
+                    
+                    # Emergency logout
+                    if self.game_state.hp_percent <= self.config.emergency_logout_hp:
+                        logger.warning("Emergency logout triggered!")
+                        self.is_running = False
+                        break
+                    
+                    # Auto heal, also when HP is projected to cross the threshold before we could react again
+                    expected_latency = self.loop_interval + self.heal_latency
+                    if (self.config.auto_heal and 
+                        (self.game_state.hp_percent <= self.config.heal_at_hp or
+                         (self.config.predictive_heal and self.time_to_heal is not None and
+                          self.time_to_heal <= expected_latency))):
+                        cast_start = time.time()
+                        await asyncio.to_thread(self.automation.cast_spell, self.config.heal_spell)
+                        self.heal_latency = 0.8 * self.heal_latency + 0.2 * (time.time() - cast_start)
+                        self.update_stats('heals_used')
+                    
+                    # Auto mana
+                    if (self.config.auto_heal and 
+                        self.game_state.mp_percent <= self.config.heal_at_mp):
+                        await asyncio.to_thread(self.automation.cast_spell, self.config.heal_mana_spell)
+                        self.update_stats('heals_used')
+                    
+                    # Auto food
+                    if self.config.auto_food and random.random() < 0.05:  # 5% chance per cycle
+                        await asyncio.to_thread(self.automation.use_food)
+                        self.update_stats('food_used')
+                    
+                    # Auto attack
+                    creatures = detections['creatures'] or []
+                    if self.config.auto_attack:
+                        if creatures:
+                            target = creatures[0]  # Attack closest creature
+                            await asyncio.to_thread(self.automation.attack_creature, target, self.config.attack_spell)
+                            self.update_stats('attacks_made')
+                            self.last_target = target
                             self.game_state.target_creature = target.name
-                
-                # Auto loot
-                if self.config.auto_loot:
-                    loot_items = self.detector.detect_loot(screenshot, self.config.loot_items)
-                    for item in loot_items:
-                        self.automation.loot_item(item)
-                        self.update_stats('items_looted')
                         
-                        # If using loot all and filter, might need to discard
-                        if (self.config.loot_all_and_filter and 
-                            item.name in self.config.discard_items):
-                            self.automation.drop_item(item.name)
-                            self.update_stats('items_discarded')
+                            # Demo mode has no server log: chance to kill creature
+                            if self.detector.simulated and random.random() < 0.3:
+                                self.register_kill(target.name)
+                    
+                    # Exact kill, drop and exp accounting from the server log
+                    for event in detections['log_events'] or []:
+                        if event.kind == 'kill':
+                            self.register_kill(event.creature)
+                            self.update_stats('items_dropped', sum(count for count, _ in event.items))
+                        elif event.kind == 'exp':
+                            self.update_stats('exp_gained', event.exp)
+                    
+                    # Auto loot
+                    if self.config.auto_loot:
+                        for item in detections['loot_items'] or []:
+                            await asyncio.to_thread(self.automation.loot_item, item)
+                            self.kill_index.consume(item.x, item.y)
+                            self.update_stats('items_looted')  # Stacks picked up, not item quantities
+                        
+                            # If using loot all and filter, might need to discard
+                            if (self.config.loot_all_and_filter and 
+                                item.name in self.plan.discard_items):
+                                await asyncio.to_thread(self.automation.drop_item, item.name)
+                                self.update_stats('items_discarded')
+                    
+                    # Auto walk (waypoints), rejoining the route once a fight is over
+                    if self.config.auto_walk and self.config.waypoints:
+                        if self.in_combat and not self.game_state.target_creature:
+                            # Up to a few A* searches; kept off the event loop
+                            await asyncio.to_thread(self.resume_nearest_waypoint, detections['position'])
+                        await self.execute_waypoint_movement(detections['position'], locate=False)
+                    self.in_combat = self.game_state.target_creature is not None
+                    
+                    # Anti-idle
+                    if self.config.anti_idle and random.random() < 0.02:  # 2% chance per cycle
+                        await asyncio.to_thread(self.automation.anti_idle_action)
+                    
+                finally:
+                    # Retire the frame and its intermediates, also when the tick bails out early
+                    if frame is not None:
+                        frame.release()
                 
-                # Auto walk (waypoints)
+                # Next iteration sooner when there is something going on, with human-like jitter
+                activity = 0.0
                 if self.config.auto_walk and self.config.waypoints:
-                    await self.execute_waypoint_movement()
-                
-                # Anti-idle
-                if self.config.anti_idle and random.random() < 0.02:  # 2% chance per cycle
-                    self.automation.anti_idle_action()
-                
-                # Broadcast stats
-                await self.broadcast_stats()
-                
-                # Random delay between main loop iterations
-                await asyncio.sleep(random.uniform(0.5, 2.0))
+                    activity = 0.5
+                if self.kill_index:
+                    activity = max(activity, 0.6)
+                if creatures or self.game_state.target_creature or self.vitals.hp_rate() < -1.0:
+                    activity = 1.0
+                interval = self.governor.update(activity)
+                # Corpses outlive the throttled rescan period (at the slowest jittered tick)
+                self.kill_index.fit_ttl(interval * 1.2 * self.cpu_budget.loot_scan_every)
+                LOOP_TICK_SECONDS.observe(time.perf_counter() - tick_start)
+                await asyncio.sleep(interval * random.uniform(0.8, 1.2))
                 
             except Exception as e:
                 logger.error(f"Error in bot main loop: {e}")
@@ -780,63 +1575,209 @@ class TibiaBot:
         
         logger.info("Bot main loop ended")
     
-    async def execute_waypoint_movement(self):
-        """Execute waypoint-based movement"""
+    async def telemetry_loop(self):
+        """Publish status to dashboards at a fixed rate, independent of the bot loop rate"""
+        rate_hz = self.config.telemetry_rate_hz if self.config else 2.0
+        interval = 1.0 / max(rate_hz, 0.1)
+        next_tick = time.monotonic()
+        
+        while self.is_running:
+            try:
+                # Everything that changed since the last tick goes out as one delta
+                self.broadcast_stats()
+            except Exception as e:
+                logger.error(f"Error publishing telemetry: {e}")
+            
+            # Fixed schedule; ticks missed while the event loop was busy are skipped, not replayed
+            next_tick += interval
+            now = time.monotonic()
+            if next_tick < now:
+                next_tick = now + interval
+            await asyncio.sleep(next_tick - now)
+        
+        # Let dashboards see the bot stop
+        self.broadcast_stats()
+    
+    async def execute_waypoint_movement(self, position: Optional[Tuple[int, int, int]] = None,
+                                        locate: bool = True):
+        """Execute waypoint-based movement, advancing when the character arrives
+        
+        With `locate=False`, `position` is the one found by the pipeline this tick.
+        """
         try:
-            current_time = time.time() * 1000  # Convert to milliseconds
-            
-            if current_time - self.last_waypoint_time < self.config.waypoint_delay:
-                return
-            
             waypoints = self.config.waypoints
             if not waypoints:
                 return
             
-            # Get current waypoint
+            now = time.time()
+            self.current_waypoint_index = min(self.current_waypoint_index, len(waypoints) - 1)
             current_waypoint = waypoints[self.current_waypoint_index]
             
-            # Move to waypoint
-            self.automation.move_to_position(current_waypoint['x'], current_waypoint['y'])
+            if locate:
+                with self.cpu_budget.measure('position'):
+                    position = self.detector.locate()
+            
+            # Without a position fix, fall back to time-based progression
+            if position is None:
+                if now * 1000 - self.last_waypoint_time < self.config.waypoint_delay:
+                    return
+                await asyncio.to_thread(self.automation.move_to_position, current_waypoint['x'], current_waypoint['y'])
+                logger.info(f"Walking to waypoint: {current_waypoint['name']} "
+                           f"({current_waypoint['x']}, {current_waypoint['y']})")
+                self.advance_waypoint(waypoints)
+                self.last_waypoint_time = now * 1000
+                return
             
-            logger.info(f"Walking to waypoint: {current_waypoint['name']} "
-                       f"({current_waypoint['x']}, {current_waypoint['y']})")
+            goal = (current_waypoint['x'], current_waypoint['y'], current_waypoint.get('z', position[2]))
+            distance = max(abs(goal[0] - position[0]), abs(goal[1] - position[1]))
+            if goal[2] != position[2]:
+                distance = float('inf')
+            
+            if self.leg_started_at is None:
+                self.leg_started_at = now
+                self.leg_best_distance = distance
+                self.leg_progress_time = now
+            
+            # Arrived: record the leg and move on
+            if distance <= self.config.waypoint_tolerance:
+                leg_time = now - self.leg_started_at
+                self.waypoint_legs.append({
+                    'waypoint': current_waypoint['name'],
+                    'seconds': round(leg_time, 2),
+                    'finished_at': datetime.utcnow()
+                })
+                logger.info(f"Reached waypoint {current_waypoint['name']} in {leg_time:.1f}s")
+                self.leg_start = goal
+                self.leg_started_at = None
+                self.leg_step = None
+                self.last_waypoint_time = 0
+                self.advance_waypoint(waypoints)
+                return
             
-            # Update waypoint index based on mode
-            if self.config.waypoint_mode == "loop":
-                self.current_waypoint_index = (self.current_waypoint_index + 1) % len(waypoints)
+            if distance < self.leg_best_distance:
+                self.leg_best_distance = distance
+                self.leg_progress_time = now
             
-            elif self.config.waypoint_mode == "back_and_forth":
-                self.current_waypoint_index += self.waypoint_direction
-                
-                # Change direction at endpoints
-                if self.current_waypoint_index >= len(waypoints) - 1:
-                    self.waypoint_direction = -1
-                elif self.current_waypoint_index <= 0:
-                    self.waypoint_direction = 1
-                
-                # Clamp to valid range
-                self.current_waypoint_index = max(0, min(self.current_waypoint_index, len(waypoints) - 1))
+            # Click again only once the last clicked tile is reached or progress stalls
+            stalled = (now - self.leg_progress_time) * 1000 >= self.config.waypoint_stall_timeout
+            if self.leg_step is not None and position != self.leg_step and not stalled:
+                return
             
-            elif self.config.waypoint_mode == "once":
-                if self.current_waypoint_index < len(waypoints) - 1:
-                    self.current_waypoint_index += 1
-                else:
-                    # Reached end, disable auto walk
-                    self.config.auto_walk = False
-                    logger.info("Waypoint sequence completed - disabling auto walk")
+            if stalled:
+                logger.info(f"No progress towards {current_waypoint['name']}, re-issuing move")
+                self.leg_progress_time = now
             
-            self.last_waypoint_time = current_time
+            # Move to waypoint
+            step = None
+            if self.pathfinder:
+                step = await asyncio.to_thread(self.walk_towards, current_waypoint, position)
+            if step is None:
+                # Click the tile in the waypoint's direction, clamped to the visible area
+                step = (position[0] + max(-7, min(7, goal[0] - position[0])),
+                        position[1] + max(-5, min(5, goal[1] - position[1])),
+                        position[2])
+                x, y = self.detector.tile_to_screen(position, step)
+                await asyncio.to_thread(self.automation.move_to_position, x, y)
+            
+            self.leg_step = step
             
         except Exception as e:
             logger.error(f"Error in waypoint movement: {e}")
     
+    def advance_waypoint(self, waypoints: List[Dict[str, Any]]):
+        """Update waypoint index based on mode"""
+        if self.config.waypoint_mode == "loop":
+            self.current_waypoint_index = (self.current_waypoint_index + 1) % len(waypoints)
+        
+        elif self.config.waypoint_mode == "back_and_forth":
+            self.current_waypoint_index += self.waypoint_direction
+            
+            # Change direction at endpoints
+            if self.current_waypoint_index >= len(waypoints) - 1:
+                self.waypoint_direction = -1
+            elif self.current_waypoint_index <= 0:
+                self.waypoint_direction = 1
+            
+            # Clamp to valid range
+            self.current_waypoint_index = max(0, min(self.current_waypoint_index, len(waypoints) - 1))
+        
+        elif self.config.waypoint_mode == "once":
+            if self.current_waypoint_index < len(waypoints) - 1:
+                self.current_waypoint_index += 1
+            else:
+                # Reached end, disable auto walk
+                self.config.auto_walk = False
+                logger.info("Waypoint sequence completed - disabling auto walk")
+    
+    def resume_nearest_waypoint(self, position: Optional[Tuple[int, int, int]] = None):
+        """Rejoin the route at the nearest reachable waypoint ahead (after a restart, death or combat)
+        
+        Locates the character first unless `position` is given.
+        """
+        try:
+            if not self.config or not self.config.waypoints:
+                return
+            
+            if position is None:
+                position = self.detector.locate()
+            if position is None:
+                return
+            
+            key = WaypointIndex.key(self.config.waypoints, position[2])
+            if key != self.waypoint_index_key:
+                self.waypoint_index = WaypointIndex(self.config.waypoints, position[2])
+                self.waypoint_index_key = key
+            
+            current = min(self.current_waypoint_index, len(self.config.waypoints) - 1)
+            resumed = self.waypoint_index.resume(
+                position, self.config.waypoint_mode, current, self.waypoint_direction, self.pathfinder
+            )
+            if resumed is None:
+                return
+            
+            index, direction = resumed
+            if index != self.current_waypoint_index:
+                logger.info(f"Resuming route at waypoint {self.config.waypoints[index]['name']} "
+                            f"(was {self.current_waypoint_index})")
+            self.current_waypoint_index = index
+            self.waypoint_direction = direction
+            self.leg_start = position
+            self.leg_started_at = None
+            self.leg_step = None
+            self.last_waypoint_time = 0
+            
+        except Exception as e:
+            logger.error(f"Error resuming route: {e}")
+    
+    def walk_towards(self, waypoint: Dict[str, Any],
+                     position: Tuple[int, int, int]) -> Optional[Tuple[int, int, int]]:
+        """Click the next visible step of the planned path to a waypoint and return it; None if no path is known"""
+        
+        goal = (waypoint['x'], waypoint['y'], waypoint.get('z', position[2]))
+        if position == goal:
+            return goal
+        
+        # Legs between waypoints are planned once and cached; replan from here if we drifted off
+        path = self.pathfinder.find_path(self.leg_start, goal) if self.leg_start else None
+        if not path or min(max(abs(t[0] - position[0]), abs(t[1] - position[1])) for t in path) > 1:
+            path = self.pathfinder.find_path(position, goal)
+        if not path:
+            return None
+        
+        step = Pathfinder.next_step(path, position)
+        x, y = self.detector.tile_to_screen(position, step)
+        self.automation.move_to_position(x, y)
+        return step
+    
     def get_current_position(self) -> Dict[str, Any]:
         """Get current player position"""
         try:
             x, y = self.detector.get_current_position()
+            z = self.detector.last_position[2] if self.detector.last_position else 7
             return {
                 'x': x,
                 'y': y,
+                'z': z,
                 'message': 'Posição capturada com sucesso!',
                 'timestamp': datetime.utcnow()
             }
@@ -857,6 +1798,19 @@ class TibiaBot:
         self.is_running = True
         self.is_paused = False
         self.session_id = str(uuid.uuid4())
+        self.session_saved = False
+        if self.pipeline.closed:
+            self.pipeline = self.build_pipeline()
+        self.kill_index.clear()
+        self.last_target = None
+        self.detector.server_log.reset()
+        self.detector.chat_digest = None
+        self.leg_started_at = None
+        self.leg_step = None
+        self.waypoint_legs.clear()
+        self.in_combat = False
+        self.vitals.clear()
+        self.time_to_heal = None
         
         # Reset stats
         self.stats = {
@@ -869,11 +1823,23 @@ class TibiaBot:
             'creatures_killed': 0,
             'items_looted': 0,
             'items_discarded': 0,
+            'items_dropped': 0,
             'created_at': datetime.utcnow()
         }
         
-        # Start main loop in background
+        # Loop rate bounds from the config
+        if self.config:
+            self.governor.min_rate_hz = self.config.min_loop_rate_hz
+            self.governor.max_rate_hz = max(self.config.max_loop_rate_hz, self.config.min_loop_rate_hz)
+            self.cpu_budget.budget_ms = self.config.cpu_budget_ms
+        self.governor.activity = 0.0
+        self.cpu_budget.level = 0
+        
+        # Start main loop and dashboard telemetry in background
         asyncio.create_task(self.main_loop())
+        if self.telemetry_task and not self.telemetry_task.done():
+            self.telemetry_task.cancel()
+        self.telemetry_task = asyncio.create_task(self.telemetry_loop())
         
         logger.info(f"Bot started with session ID: {self.session_id}")
         return True
@@ -882,6 +1848,8 @@ class TibiaBot:
         """Stop the bot"""
         self.is_running = False
         self.is_paused = False
+        # Stage worker threads go away; start() builds a fresh pipeline
+        self.pipeline.shutdown()
         logger.info("Bot stopped")
         return True
     
@@ -904,5 +1872,22 @@ class TibiaBot:
                 'mp_percent': self.game_state.mp_percent,
                 'is_alive': self.game_state.is_alive,
                 'target_creature': self.game_state.target_creature
+            },
+            'loop_rate_hz': round(self.governor.rate_hz, 2),
+            'pipeline_ms': {stage: round(ms, 2) for stage, ms in self.pipeline.last_timings().items()},
+            'cpu': {
+                'used_ms': round(self.cpu_budget.used_ms(), 1),
+                'budget_ms': self.cpu_budget.budget_ms,
+                'level': self.cpu_budget.level,
+                'stage_ms': {stage: round(cost, 2) for stage, cost in self.cpu_budget.stage_ms().items()}
+            },
+            'vitals': {
+                'hp_rate': round(self.vitals.hp_rate(), 2),
+                'time_to_heal_threshold': round(self.time_to_heal, 2) if self.time_to_heal is not None else None,
+                'expected_latency': round(self.loop_interval + self.heal_latency, 2)
+            },
+            'waypoints': {
+                'current_index': self.current_waypoint_index,
+                'recent_legs': list(self.waypoint_legs)[-10:]
             }
         }
\ No newline at end of file
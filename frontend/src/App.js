@@ -5,6 +5,21 @@ import axios from 'axios';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Aplica um delta do status (objetos mesclados campo a campo, o resto substituído)
+const applyPatch = (target, patch) => {
+  const result = { ...target };
+  Object.entries(patch).forEach(([key, value]) => {
+    const current = result[key];
+    if (value && typeof value === 'object' && !Array.isArray(value) &&
+        current && typeof current === 'object' && !Array.isArray(current)) {
+      result[key] = applyPatch(current, value);
+    } else {
+      result[key] = value;
+    }
+  });
+  return result;
+};
+
 // Componente principal da aplicação
 const App = () => {
   const [activeTab, setActiveTab] = useState('dashboard');
@@ -57,6 +72,7 @@ const App = () => {
   const [notification, setNotification] = useState(null);
   const [isConnected, setIsConnected] = useState(false);
   const wsRef = useRef(null);
+  const seqRef = useRef(null);
 
   // Conectar WebSocket para atualizações em tempo real
   useEffect(() => {
@@ -82,13 +98,28 @@ const App = () => {
     wsRef.current.onmessage = (event) => {
       const data = JSON.parse(event.data);
       
-      if (data.type === 'stats_update') {
+      // Snapshot completo ao conectar, depois só os campos alterados (deltas numerados)
+      if (data.type === 'snapshot') {
+        seqRef.current = data.seq;
         setBotStatus(data.data);
+      } else if (data.type === 'delta') {
+        if (seqRef.current === null || data.seq <= seqRef.current) {
+          return;
+        }
+        if (data.seq !== seqRef.current + 1) {
+          // Perdemos atualizações: pedir um snapshot novo
+          seqRef.current = null;
+          wsRef.current.send(JSON.stringify({ type: 'resync' }));
+          return;
+        }
+        seqRef.current = data.seq;
+        setBotStatus(prev => applyPatch(prev, data.data));
       }
     };
     
     wsRef.current.onclose = () => {
       setIsConnected(false);
+      seqRef.current = null;
       console.log('WebSocket desconectado');
       
       // Tentar reconectar após 3 segundos
@@ -133,7 +164,9 @@ const App = () => {
 
   const saveConfig = async () => {
     try {
-      await axios.post(`${API}/bot/config`, config);
+      const response = await axios.post(`${API}/bot/config`, config);
+      // Guardar o id estável e a versão, para os próximos salvamentos atualizarem o mesmo documento
+      setConfig(response.data.config);
       showNotification('Configuração salva com sucesso!', 'success');
     } catch (error) {
       console.error('Erro ao salvar configuração:', error);
@@ -182,14 +215,16 @@ const App = () => {
           name: waypointName,
           x: position.x,
           y: position.y,
+          z: position.z,
           description: `Capturado em ${new Date().toLocaleString()}`
         };
         
-        await axios.post(`${API}/bot/waypoint`, newWaypoint);
+        // O servidor devolve o waypoint com o id estável usado para removê-lo depois
+        const response = await axios.post(`${API}/bot/waypoint`, newWaypoint);
         
         setConfig(prev => ({
           ...prev,
-          waypoints: [...prev.waypoints, { ...newWaypoint, id: Date.now() }]
+          waypoints: [...prev.waypoints, response.data.waypoint]
         }));
         
         showNotification(`Waypoint "${waypointName}" adicionado em (${position.x}, ${position.y})`, 'success');
@@ -0,0 +1,182 @@
+import asyncio
+import json
+
+from broadcaster import CLOSE_TRY_AGAIN_LATER, Broadcaster, DeltaStream, merge_patch
+
+
+def apply_patch(target, patch):
+    """Python mirror of applyPatch in frontend/src/App.js"""
+    result = dict(target)
+    for key, value in patch.items():
+        current = result.get(key)
+        if isinstance(value, dict) and isinstance(current, dict):
+            result[key] = apply_patch(current, value)
+        else:
+            result[key] = value
+    return result
+
+
+class Client:
+    """Mirror of the dashboard's onmessage handler: applies deltas in order, resyncs on a gap"""
+
+    def __init__(self):
+        self.seq = None
+        self.state = {}
+        self.resyncs = 0
+
+    def receive(self, text):
+        frame = json.loads(text)
+        if frame['type'] == 'snapshot':
+            self.seq = frame['seq']
+            self.state = frame['data']
+        elif frame['type'] == 'delta':
+            if self.seq is None or frame['seq'] <= self.seq:
+                return
+            if frame['seq'] != self.seq + 1:
+                self.seq = None
+                self.resyncs += 1
+                return
+            self.seq = frame['seq']
+            self.state = apply_patch(self.state, frame['data'])
+
+
+class FakeWebSocket:
+    """Records what was sent; sends block while `gate` is cleared"""
+
+    def __init__(self, hang=False):
+        self.sent = []
+        self.closed_with = None
+        self.gate = asyncio.Event()
+        if not hang:
+            self.gate.set()
+
+    async def send_text(self, text):
+        await self.gate.wait()
+        self.sent.append(text)
+
+    async def send_bytes(self, data):
+        await self.gate.wait()
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def status(time_running, hp=100.0, target=None, waypoints=None):
+    return {
+        'is_running': True,
+        'stats': {'time_running': time_running, 'creatures_killed': time_running // 3},
+        'game_state': {'hp_percent': hp, 'target_creature': target},
+        'waypoints': {'recent_legs': waypoints or []}
+    }
+
+
+def test_merge_patch_round_trips_through_apply_patch():
+    states = [
+        status(0),
+        status(1, hp=80.0),
+        status(2, hp=80.0, target='rat'),
+        status(3, hp=55.5, target=None, waypoints=[{'waypoint': 'a', 'seconds': 1.5}]),
+        status(3, hp=55.5, waypoints=[]),
+        {**status(4), 'extra': {'nested': {'deep': 1}}},
+        {**status(4), 'extra': {'nested': {'deep': 2, 'new': None}}},
+    ]
+    client = {}
+    for old, new in zip([{}] + states, states):
+        patch = merge_patch(old, new)
+        if patch is not None:
+            client = apply_patch(client, patch)
+        assert client == new
+    assert merge_patch(states[-1], json.loads(json.dumps(states[-1]))) is None
+
+
+def test_delta_stream_sequence_and_gap_resync():
+    stream = DeltaStream()
+    client = Client()
+    frames = [stream.update(status(i)) for i in range(4)]
+    assert stream.update(status(3)) is None  # Unchanged: no frame, no sequence number used
+    assert [json.loads(f)['seq'] for f in frames] == [1, 2, 3, 4]
+
+    client.receive(frames[0])  # Delta before any snapshot is ignored
+    assert client.seq is None
+    client.receive(stream.snapshot())
+    assert (client.seq, client.state) == (4, status(3))
+
+    later = [stream.update(status(i)) for i in range(4, 7)]
+    client.receive(later[0])
+    client.receive(later[2])  # later[1] lost
+    assert client.seq is None and client.resyncs == 1
+    client.receive(stream.snapshot())
+    assert (client.seq, client.state) == (7, status(6))
+    client.receive(later[2])  # Stale duplicates are ignored
+    assert client.state == status(6)
+
+
+def test_slow_client_falls_back_to_snapshot():
+    async def scenario():
+        broadcaster = Broadcaster()
+        stream = DeltaStream()
+        fast, slow = FakeWebSocket(), FakeWebSocket(hang=True)
+        broadcaster.add(fast)
+        broadcaster.add(slow)
+
+        for i in range(4):
+            broadcaster.publish(stream.update(status(i)), fallback=stream.snapshot)
+            await asyncio.sleep(0.01)  # The fast client keeps up, the slow one is stuck on its first send
+
+        slow.gate.set()
+        await asyncio.sleep(0.01)
+        return broadcaster, stream, fast, slow
+
+    broadcaster, stream, fast, slow = asyncio.run(scenario())
+
+    # The fast client saw every delta; the slow one got the first delta, then a snapshot
+    fast_client, slow_client = Client(), Client()
+    fast_client.receive(json.dumps({'type': 'snapshot', 'seq': 0, 'data': {}}))
+    for text in fast.sent:
+        fast_client.receive(text)
+    assert [json.loads(t)['type'] for t in fast.sent] == ['delta'] * 4
+    assert fast_client.state == status(3)
+
+    assert [json.loads(t)['type'] for t in slow.sent] == ['delta', 'snapshot']
+    for text in slow.sent:
+        slow_client.receive(text)
+    assert (slow_client.seq, slow_client.state, slow_client.resyncs) == (4, status(3), 0)
+    assert broadcaster.stats()['dropped_frames'] >= 2
+
+
+def test_dead_client_is_closed_with_1013():
+    async def scenario():
+        broadcaster = Broadcaster(send_timeout=0.05)
+        healthy, dead = FakeWebSocket(), FakeWebSocket(hang=True)
+        broadcaster.add(healthy)
+        broadcaster.add(dead)
+
+        broadcaster.publish('{"type":"delta","seq":1,"data":{}}')
+        await asyncio.sleep(0.2)  # The dead client's send times out
+        broadcaster.publish('{"type":"delta","seq":2,"data":{}}')
+        await asyncio.sleep(0.01)
+        return broadcaster, healthy, dead
+
+    broadcaster, healthy, dead = asyncio.run(scenario())
+    assert dead.closed_with == CLOSE_TRY_AGAIN_LATER
+    assert healthy.closed_with is None
+    assert list(broadcaster.clients) == [healthy]
+    assert len(healthy.sent) == 2
+
+
+def test_client_with_full_queue_is_closed_with_1013():
+    async def scenario():
+        broadcaster = Broadcaster(max_queue=2, send_timeout=10.0)
+        stuck = FakeWebSocket(hang=True)
+        broadcaster.add(stuck)
+        for i in range(4):  # One in flight, two queued, one too many
+            broadcaster.send(stuck, f'{{"type":"pong","n":{i}}}')
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        broadcaster.publish('{"type":"delta","seq":1,"data":{}}')
+        return broadcaster, stuck
+
+    broadcaster, stuck = asyncio.run(scenario())
+    assert stuck.closed_with == CLOSE_TRY_AGAIN_LATER
+    assert len(broadcaster) == 0
@@ -0,0 +1,105 @@
+import numpy as np
+
+from pathfinding import Pathfinder, WalkabilityGrid, WaypointIndex
+
+ORIGIN = (100, 200)
+
+
+def grid(rows):
+    """Walkability from strings ('.' walkable, '#' blocked), at ORIGIN"""
+    walkable = np.array([[c == '.' for c in row] for row in rows], dtype=bool)
+    return WalkabilityGrid(ORIGIN, {7: walkable})
+
+
+def world(x, y, z=7):
+    return (ORIGIN[0] + x, ORIGIN[1] + y, z)
+
+
+def test_straight_path_excludes_start():
+    pathfinder = Pathfinder(grid(['.....']))
+    assert pathfinder.find_path(world(0, 0), world(3, 0)) == [world(1, 0), world(2, 0), world(3, 0)]
+    assert pathfinder.find_path(world(2, 0), world(2, 0)) == []
+
+
+def test_no_corner_cutting_through_blocked_diagonal():
+    pathfinder = Pathfinder(grid([
+        '.#',
+        '..',
+    ]))
+    path = pathfinder.find_path(world(0, 0), world(1, 1))
+    # The diagonal squeezes past the wall at (1, 0), so the path goes round it
+    assert path == [world(0, 1), world(1, 1)]
+
+    pathfinder = Pathfinder(grid([
+        '.#',
+        '#.',
+    ]))
+    assert pathfinder.find_path(world(0, 0), world(1, 1)) is None
+
+
+def test_unreachable_goal():
+    pathfinder = Pathfinder(grid([
+        '..#..',
+        '..#..',
+        '..#..',
+    ]))
+    assert pathfinder.find_path(world(0, 1), world(4, 1)) is None
+    # Blocked goal, goal off the map, and another floor
+    assert pathfinder.find_path(world(0, 1), world(2, 1)) is None
+    assert pathfinder.find_path(world(0, 1), world(40, 1)) is None
+    assert pathfinder.find_path(world(0, 1), world(1, 1, 8)) is None
+
+
+def test_search_widens_when_the_detour_leaves_the_margin():
+    # A wall between start and goal with its only gap 10 rows below them
+    rows = ['.' * 9 for _ in range(14)]
+    for y in range(10):
+        rows[y] = '....#....'
+    pathfinder = Pathfinder(grid(rows), margin=1)
+    calls = []
+    astar = pathfinder._astar
+    pathfinder._astar = lambda start, goal, margin: calls.append(margin) or astar(start, goal, margin)
+
+    path = pathfinder.find_path(world(2, 1), world(6, 1))
+    assert calls == [1, 8, None]
+    assert path[-1] == world(6, 1)
+    assert any(y - ORIGIN[1] >= 10 for _, y, _ in path)
+    assert all(grid(rows).is_walkable(*tile) for tile in path)
+
+    # Cached, no second search
+    assert pathfinder.find_path(world(2, 1), world(6, 1)) == path
+    assert calls == [1, 8, None]
+
+
+def test_node_limit_gives_up():
+    rows = ['.' * 40 for _ in range(40)]
+    assert Pathfinder(grid(rows), max_nodes=100).find_path(world(0, 0), world(39, 39)) is not None
+    # Same distance, but the wall forces a search over most of the map
+    rows[20] = '#' * 39 + '.'
+    assert Pathfinder(grid(rows), max_nodes=100).find_path(world(0, 0), world(0, 39)) is None
+    assert Pathfinder(grid(rows)).find_path(world(0, 0), world(0, 39)) is not None
+
+
+ROUTE = [{'x': x, 'y': 0, 'z': 7} for x in (0, 10, 20, 30, 40)]
+
+
+def test_resume_skips_waypoints_already_passed():
+    index = WaypointIndex(ROUTE)
+    # Nearest is waypoint 1, but a one-way route already heading for 3 keeps going
+    assert index.resume((9, 3, 7), 'once', current=3) == (3, 1)
+    assert index.resume((9, 3, 7), 'once', current=1) == (1, 1)
+    # Between waypoints 1 and 2: head for 2
+    assert index.resume((16, 0, 7), 'once', current=0) == (2, 1)
+    assert index.resume((9, 3, 7), 'loop', current=3) == (1, 1)
+    assert index.resume((9, 3, 9), 'loop') is None
+
+
+def test_resume_back_and_forth_keeps_or_turns_direction():
+    index = WaypointIndex(ROUTE)
+    # Walking back towards 0: waypoint 2 is behind, 1 is ahead
+    assert index.resume((19, 0, 7), 'back_and_forth', current=1, direction=-1) == (1, -1)
+    # Nothing ahead is reachable: turn around
+    blocked = Pathfinder(WalkabilityGrid((-5, -5), {7: np.array([[True] * 20 + [False] + [True] * 40] * 10)}))
+    assert index.resume((19, 0, 7), 'back_and_forth', current=1, direction=-1, pathfinder=blocked) == (2, 1)
+    # Ending up at an end of the route leaves it in the other direction
+    assert index.resume((40, 3, 7), 'back_and_forth', current=3, direction=1) == (4, -1)
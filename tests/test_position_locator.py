@@ -0,0 +1,70 @@
+import json
+
+import numpy as np
+import pytest
+
+from position_locator import MinimapLocator
+
+ORIGIN = (32000, 31000)
+MINIMAP = 106
+
+
+@pytest.fixture
+def atlas_dir(tmp_path):
+    """Two floors of random terrain from a small palette, one pixel per tile"""
+    rng = np.random.default_rng(7)
+    palette = rng.integers(0, 256, size=(6, 3), dtype=np.uint8)
+    for z in (7, 8):
+        np.save(tmp_path / f'floor_{z}.npy', palette[rng.integers(0, len(palette), size=(240, 300))])
+    with open(tmp_path / 'atlas.json', 'w', encoding='utf-8') as f:
+        json.dump({'origin': list(ORIGIN), 'floors': [7, 8]}, f)
+    return tmp_path
+
+
+def crop(locator, z, left, top):
+    """Minimap centered on a known tile, and that tile's world position"""
+    minimap = np.array(locator.floors[z][top:top + MINIMAP, left:left + MINIMAP])
+    return minimap, (ORIGIN[0] + left + MINIMAP // 2, ORIGIN[1] + top + MINIMAP // 2, z)
+
+
+def test_global_search_finds_crop(atlas_dir):
+    locator = MinimapLocator(str(atlas_dir))
+    minimap, expected = crop(locator, 8, 121, 37)
+
+    assert locator.last_position is None
+    assert locator.locate(minimap) == expected
+    assert locator.last_position == expected
+    # The inverted index was cached next to the atlas
+    assert (atlas_dir / 'index_8.npz').exists()
+
+
+def test_local_search_near_last_position(atlas_dir, monkeypatch):
+    locator = MinimapLocator(str(atlas_dir))
+    minimap, expected = crop(locator, 7, 90, 60)
+    locator.last_position = (expected[0] - 5, expected[1] + 3, 7)
+
+    def no_global(minimap):
+        raise AssertionError("global search used although the player moved only a few tiles")
+
+    monkeypatch.setattr(locator, '_global_search', no_global)
+    assert locator.locate(minimap) == expected
+
+
+def test_falls_back_to_global_search(atlas_dir, monkeypatch):
+    locator = MinimapLocator(str(atlas_dir))
+    minimap, expected = crop(locator, 7, 150, 100)
+    # Teleported: far outside the local window, and on another floor
+    locator.last_position = (ORIGIN[0] + 60, ORIGIN[1] + 60, 8)
+
+    calls = []
+    global_search = locator._global_search
+    monkeypatch.setattr(locator, '_global_search', lambda minimap: calls.append(1) or global_search(minimap))
+    assert locator.locate(minimap) == expected
+    assert calls == [1]
+
+
+def test_unknown_minimap_is_not_located(atlas_dir):
+    locator = MinimapLocator(str(atlas_dir))
+    minimap = np.random.default_rng(1).integers(0, 256, size=(MINIMAP, MINIMAP, 3), dtype=np.uint8)
+    assert locator.locate(minimap) is None
+    assert locator.last_position is None
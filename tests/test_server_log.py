@@ -0,0 +1,65 @@
+from server_log import ServerLogParser, parse_items, parse_line, same_line
+
+
+def L(minute):
+    return f"12:{minute:02d} Loot of a rat: 2 gold coins, cheese."
+
+
+def X(minute):
+    return f"12:{minute:02d} You gained 5 experience points."
+
+
+def read(parser, lines):
+    return parser.feed('\n'.join(lines))
+
+
+def test_parse_line():
+    event = parse_line("12:34 Loot of a dragon: 57 gold coins, a dragon ham, an apple.")
+    assert event.kind == 'kill' and event.creature == 'dragon'
+    assert event.items == [(57, 'gold coins'), (1, 'dragon ham'), (1, 'apple')]
+    assert parse_line("12:34 Loot of a rat: nothing.").items == []
+    event = parse_line("12:35 You gained 1,250 experience points.")
+    assert event.kind == 'exp' and event.exp == 1250
+    assert parse_line("12:36 You see a rat.") is None
+
+
+def test_parse_items():
+    assert parse_items("4 gold coins, cheese") == [(4, 'gold coins'), (1, 'cheese')]
+    assert parse_items("nothing") == []
+
+
+def test_same_line_tolerates_misread_letters_but_not_numbers():
+    assert same_line("12:03 Loot of a rat: nothing.", "12:03 Loot of a rat: nothinq.")
+    assert not same_line("12:02 Loot of a rat: nothing.", "12:03 Loot of a rat: nothing.")
+    assert not same_line("12:03 You gained 5 experience points.", "12:03 You gained 6 experience points.")
+
+
+def test_first_read_only_primes():
+    parser = ServerLogParser()
+    assert read(parser, [L(1), X(1)]) == []
+
+
+def test_scrolled_lines_are_counted_once():
+    parser = ServerLogParser()
+    read(parser, [L(1), X(1), L(2), X(2)])
+    events = read(parser, [L(2), X(2), L(3), X(3)])
+    assert [e.kind for e in events] == ['kill', 'exp']
+    events = read(parser, [L(3), X(3), L(4), X(4)])
+    assert [e.kind for e in events] == ['kill', 'exp']
+    # OCR noise on lines already seen does not make them new
+    events = read(parser, [L(3).replace('cheese', 'cheeze'), X(3), L(4).replace('Loot', 'Lout'), X(4), L(5)])
+    assert [(e.kind, e.creature) for e in events] == [('kill', 'rat')]
+
+
+def test_repeated_message_is_not_mistaken_for_the_same_read():
+    parser = ServerLogParser()
+    read(parser, [X(1), X(1), X(1)])
+    # The panel changed, so a line scrolled in even though the text is identical
+    assert [e.exp for e in read(parser, [X(1), X(1), X(1)])] == [5]
+
+
+def test_unaligned_read_is_dropped():
+    parser = ServerLogParser()
+    read(parser, [L(1), X(1)])
+    assert read(parser, [L(7), X(7)]) == []
+    assert [e.kind for e in read(parser, [X(7), L(8)])] == ['kill']
@@ -0,0 +1,123 @@
+import cv2
+import numpy as np
+import pytest
+
+from template_bank import FFTTemplateBank
+
+
+def random_scene(seed=0, size=(64, 80), sprites=((0, 9, 9), (1, 12, 7))):
+    """Random image with random sprites planted at known top-left corners"""
+    rng = np.random.default_rng(seed)
+    image = rng.uniform(0, 255, size).astype(np.float32)
+    templates = {}
+    corners = {}
+    for index, th, tw in sprites:
+        name = f'sprite_{index}'
+        sprite = rng.uniform(0, 255, (th, tw)).astype(np.float32)
+        y, x = 6 + 24 * index, 10 + 30 * index  # Even, so they survive 2x pooling
+        image[y:y + th, x:x + tw] = sprite
+        templates[name] = sprite
+        corners[name] = (y, x)
+    return image, templates, corners
+
+
+def test_scores_match_cv2_ccoeff_normed():
+    image, templates, _ = random_scene()
+    bank = FFTTemplateBank(templates, default_threshold=0.3)
+
+    for name, sprite in templates.items():
+        th, tw = sprite.shape
+        expected = cv2.matchTemplate(image, sprite, cv2.TM_CCOEFF_NORMED)
+        for _, x, y, score in bank.match(image, names=[name], max_matches=10):
+            top, left = y - th // 2, x - tw // 2
+            assert score == pytest.approx(float(expected[top, left]), abs=1e-3)
+
+
+def test_best_match_is_cv2_maximum():
+    image, templates, corners = random_scene(seed=1)
+    bank = FFTTemplateBank(templates)
+
+    matches = {name: (x, y, score) for name, x, y, score in bank.match(image)}
+    for name, sprite in templates.items():
+        th, tw = sprite.shape
+        expected = cv2.matchTemplate(image, sprite, cv2.TM_CCOEFF_NORMED)
+        _, best, _, (left, top) = cv2.minMaxLoc(expected)
+        assert (top, left) == corners[name]
+        x, y, score = matches[name]
+        assert (x, y) == (left + tw // 2, top + th // 2)
+        assert score == pytest.approx(best, abs=1e-3)
+
+
+def test_color_input_matches_grayscale():
+    image, templates, _ = random_scene(seed=2)
+    bank = FFTTemplateBank(templates)
+    bgr = np.repeat(image[:, :, None], 3, axis=2)
+    assert [m[:3] for m in bank.match(bgr)] == [m[:3] for m in bank.match(image)]
+
+
+def test_subset_shares_kernels_and_thresholds():
+    image, templates, _ = random_scene(seed=3)
+    bank = FFTTemplateBank(templates, thresholds={'sprite_1': 0.5}, default_threshold=0.9)
+    bank.match(image)  # Populate the spectrum cache
+
+    small = bank.subset(['sprite_1', 'missing', 'sprite_1'])
+    assert small.names == ['sprite_1']
+    assert small.thresholds.tolist() == [pytest.approx(0.5)]
+    np.testing.assert_array_equal(small.kernels[0], bank.kernels[bank.index['sprite_1']])
+    assert set(small._spectra) == set(bank._spectra)
+    assert [m[:3] for m in small.match(image)] == [m[:3] for m in bank.match(image, names=['sprite_1'])]
+
+
+def test_downscaled_halves_sprites_and_is_cached():
+    image, templates, corners = random_scene(seed=4, sprites=((0, 12, 12), (1, 16, 10)))
+    bank = FFTTemplateBank(templates, default_threshold=0.6)
+
+    assert bank.downscaled(0) is bank
+    half = bank.downscaled(1)
+    assert half is bank.downscaled(1)
+    assert half.shapes == [(6, 6), (8, 5)]
+    assert half.thresholds.tolist() == pytest.approx(bank.thresholds.tolist())
+
+    # Matching on a half-resolution frame finds the sprites at half the coordinates
+    h, w = image.shape[0] // 2, image.shape[1] // 2
+    small = image[:h * 2, :w * 2].reshape(h, 2, w, 2).mean(axis=(1, 3))
+    found = {name: (x, y) for name, x, y, _ in half.match(small)}
+    for name, (top, left) in corners.items():
+        th, tw = half.shapes[half.index[name]]
+        x, y = found[name]
+        assert abs(x - (left // 2 + tw // 2)) <= 1 and abs(y - (top // 2 + th // 2)) <= 1
+
+
+def test_updated_matches_a_fresh_bank():
+    rng = np.random.default_rng(5)
+    sprite = lambda h, w: rng.uniform(0, 255, (h, w)).astype(np.float32)
+    templates = {
+        'a': {'sprite': sprite(8, 8)},
+        'b': {'sprite': sprite(10, 6), 'threshold': 0.7},
+        'c': {'sprite': sprite(12, 12)},
+    }
+    image = rng.uniform(0, 255, (60, 70)).astype(np.float32)
+    bank = FFTTemplateBank.from_templates(templates)
+    bank.match(image)  # Cache spectra, which must carry over
+
+    changed = {'b': {'sprite': sprite(14, 9), 'threshold': 0.6}, 'd': {'sprite': sprite(7, 11)}}
+    image[30:44, 40:49] = changed['b']['sprite']
+    image[5:12, 50:61] = changed['d']['sprite']
+    updated = bank.updated(changed, removed=['c'])
+    fresh = FFTTemplateBank.from_templates({'a': templates['a'], **changed})
+
+    assert sorted(updated.names) == sorted(fresh.names)
+    for name in fresh.names:
+        i, j = updated.index[name], fresh.index[name]
+        assert updated.shapes[i] == fresh.shapes[j]
+        assert updated.thresholds[i] == pytest.approx(fresh.thresholds[j])
+        h, w = fresh.shapes[j]
+        np.testing.assert_allclose(updated.kernels[i, :h, :w], fresh.kernels[j, :h, :w], atol=1e-6)
+
+    expected = sorted(fresh.match(image))
+    result = sorted(updated.match(image))
+    assert [m[:3] for m in result] == [m[:3] for m in expected]
+    assert [m[3] for m in result] == pytest.approx([m[3] for m in expected], abs=1e-4)
+    assert {'b', 'd'} <= {m[0] for m in result}
+    # The original bank is untouched
+    assert bank.names == ['a', 'b', 'c']